@@ -0,0 +1,183 @@
+#
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# mPlane Protocol Reference Implementation
+# Micro-benchmarks for the information model
+#
+# (c) 2013-2014 mPlane Consortium (http://www.ict-mplane.eu)
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Micro-benchmarks for the mPlane reference implementation. 
+Run with python3 -m mplane.benchmark.
+
+"""
+
+import gc
+import time
+import itertools
+import tracemalloc
+import argparse
+import collections
+from datetime import datetime, timedelta
+import mplane.model
+
+def _bench_capability():
+    cap = mplane.model.Capability(label="ping-average-ip4", 
+                                  when="now ... future / 1s")
+    cap.add_parameter("source.ip4", "10.0.27.2")
+    cap.add_parameter("destination.ip4")
+    cap.add_result_column("delay.twoway.icmp.us.min")
+    cap.add_result_column("delay.twoway.icmp.us.mean")
+    cap.add_result_column("delay.twoway.icmp.us.max")
+    cap.add_result_column("delay.twoway.icmp.us.count")
+    return cap
+
+def _bench_specification(cap, i):
+    spec = mplane.model.Specification(capability=cap)
+    spec.set_single_values()
+    spec.set_parameter_value("destination.ip4", "10.1.%u.%u" % (i // 256 % 256, i % 256))
+    spec.set_when("now + 1m / 1s")
+    return spec
+
+def _bench_result(spec):
+    res = mplane.model.Result(specification=spec)
+    res.set_when("2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    res.set_result_value("delay.twoway.icmp.us.min", 33155)
+    res.set_result_value("delay.twoway.icmp.us.mean", 55166)
+    res.set_result_value("delay.twoway.icmp.us.max", 192307)
+    res.set_result_value("delay.twoway.icmp.us.count", 58220)
+    return res
+
+def _bytes_per(make, count):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = [make(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return (after - before) / count
+
+def memory_per_statement(count=10000):
+    """
+    Return the number of bytes allocated per Specification, Receipt, 
+    and Result derived from a ping capability, as measured by tracemalloc.
+    Specifications are kept alive while measuring Receipts and Results, so
+    only memory not shared with the Specification is counted.
+
+    """
+    cap = _bench_capability()
+    specs = []
+    def make_spec(i):
+        spec = _bench_specification(cap, i)
+        specs.append(spec)
+        return spec
+    out = {}
+    out["specification"] = _bytes_per(make_spec, count)
+    out["receipt"] = _bytes_per(
+                lambda i: mplane.model.Receipt(specification=specs[i]), count)
+    out["result"] = _bytes_per(lambda i: _bench_result(specs[i]), count)
+    return out
+
+def _stepping_datetime_iterator(schedule, t):
+    """
+    Reference implementation of Schedule.datetime_iterator(), stepping 
+    through time one period at a time and checking each cron set.
+
+    """
+    when = schedule._when
+    period = when.period()
+    if period is None:
+        period = timedelta(seconds=1)
+
+    lag = when.sort_scope(t)
+    if lag < 0:
+        t += timedelta(seconds=-lag)
+
+    t -= period
+    while True:
+        t += period
+        if not when.in_scope(t):
+            break
+        if len(schedule._seconds) and (t.second not in schedule._seconds):
+            continue
+        if len(schedule._minutes) and (t.minute not in schedule._minutes):
+            continue
+        if len(schedule._hours) and (t.hour not in schedule._hours):
+            continue
+        if len(schedule._days) and (t.day not in schedule._days):
+            continue
+        if len(schedule._weekdays) and (t.weekday() not in schedule._weekdays):
+            continue
+        if len(schedule._months) and (t.month not in schedule._months):
+            continue
+        yield t
+
+_bench_schedules = collections.OrderedDict((
+    ("dense (every 10s)", {mplane.model.KEY_SECONDS: "0,10,20,30,40,50"}),
+    ("hourly", {mplane.model.KEY_MINUTES: "0", mplane.model.KEY_SECONDS: "0"}),
+    ("sparse (hour 3, day 1)", {mplane.model.KEY_DAYS: "1", mplane.model.KEY_HOURS: "3",
+                   mplane.model.KEY_MINUTES: "0", mplane.model.KEY_SECONDS: "0"}),
+))
+
+def schedule_iteration(count=10):
+    """
+    Return the time in seconds taken to generate the first count
+    datetimes of a dense, an hourly, and a sparse Schedule, 
+    by Schedule.datetime_iterator() and by stepping through time.
+
+    """
+    t0 = datetime(2014, 12, 24, 22, 18, 42)
+    out = collections.OrderedDict()
+    for (label, cron) in _bench_schedules.items():
+        d = dict(cron)
+        d[mplane.model.KEY_WHEN] = "2014-01-01 00:00:00 ... future"
+        sched = mplane.model.Schedule(dictval=d)
+
+        start = time.perf_counter()
+        direct = list(itertools.islice(sched.datetime_iterator(t0), count))
+        direct_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stepped = list(itertools.islice(_stepping_datetime_iterator(sched, t0), count))
+        stepped_time = time.perf_counter() - start
+
+        if direct != stepped:
+            raise ValueError("Schedule iterators disagree for "+label)
+        out[label] = (direct_time, stepped_time)
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="mPlane RI micro-benchmarks")
+    parser.add_argument('--count', '-n', type=int, default=10000,
+                        help="Number of objects or iterations per benchmark")
+    parser.add_argument('--fires', type=int, default=3,
+                        help="Number of schedule firings per benchmark")
+    args = parser.parse_args()
+
+    mplane.model.initialize_registry()
+
+    print("memory per statement (bytes):")
+    for (kind, size) in memory_per_statement(args.count).items():
+        print("  %-16s %10.0f" % (kind, size))
+
+    print("schedule iteration, %u firings (direct / stepping, seconds):" % args.fires)
+    for (label, (direct, stepped)) in schedule_iteration(args.fires).items():
+        print("  %-24s %10.6f %10.6f" % (label, direct, stepped))
+
+if __name__ == "__main__":
+    main()
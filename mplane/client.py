@@ -42,6 +42,10 @@ import argparse
 from datetime import datetime, timedelta
 
 CAPABILITY_PATH_ELEM = "capability"
+STREAM_CHUNK_SIZE = 65536
+
+ACCEPT_JSON = mplane.model.MIME_JSON
+ACCEPT_ANY = mplane.model.MIME_BINARY + ", " + mplane.model.MIME_JSON + ";q=0.5"
 
 """
 Generic mPlane client for HTTP component-push workflows.
@@ -64,6 +68,17 @@ class CrawlParser(html.parser.HTMLParser):
         if tag == "a" and "href" in attrs:
             self.urls.append(attrs["href"])
 
+def _stream_body(res):
+    """
+    Iterate over the body of an unpreloaded urllib3 response in chunks,
+    releasing the connection when done.
+
+    """
+    try:
+        yield from res.stream(STREAM_CHUNK_SIZE)
+    finally:
+        res.release_conn()
+
 class HttpClient(object):
     """
     Implements an mPlane HTTP client endpoint for component-push workflows. 
@@ -73,8 +88,12 @@ class HttpClient(object):
 
     Caches retrieved Capabilities, Receipts, and Results.
 
+    Unless binary is False, the client asks for the mPlane binary encoding
+    in preference to JSON, and posts messages in the binary encoding 
+    once the component has replied with it.
+
     """
-    def __init__(self, security, posturl, capurl=None, certfile=None):
+    def __init__(self, security, posturl, capurl=None, certfile=None, binary=True):
         # store urls
         self._posturl = posturl
         if capurl is not None:
@@ -99,38 +118,82 @@ class HttpClient(object):
 
         print("new client: "+self._posturl+" "+self._capurl)
 
+        # negotiate binary encoding
+        self._accept = ACCEPT_ANY if binary else ACCEPT_JSON
+        self._post_binary = False
+
         # empty capability and measurement lists
         self._capabilities = []
         self._receipts = []
         self._results = []
 
-    def get_mplane_reply(self, url=None, postmsg=None):
+    def get_mplane_reply(self, url=None, postmsg=None, wait=None):
         """
         Given a URL, parses the object at the URL as an mPlane 
         message and processes it.
 
         Given a message to POST, sends the message to the given 
-        URL and processes the reply as an mPlane message.
+        URL and processes the reply as an mPlane message. If wait is 
+        given, asks the component to hold the reply for up to wait 
+        seconds until a result is available.
 
         """
-        if postmsg is not None:
-            print(postmsg)
-            if url is None:
-                url = "/"
-            res = self.pool.urlopen('POST', url, 
-                    body=mplane.model.unparse_json(postmsg).encode("utf-8"), 
-                    headers={"content-type": "application/x-mplane+json"})
+        res = self._mplane_request(url, postmsg, self._accept, wait)
+        content_type = res.getheader("content-type")
+        if res.status == 200 and content_type == mplane.model.MIME_BINARY:
+            print("parsing binary")
+            self._post_binary = True
+            msg = mplane.model.parse_binary(res.data)
+            res.release_conn()
+            return msg
+        elif res.status == 200 and content_type == mplane.model.MIME_JSON:
+            print("parsing json")
+            return mplane.model.parse_json_stream(_stream_body(res)).read_rows()
         else:
-            res = self.pool.request('GET', url)
-        print("get_mplane_reply "+url+" "+str(res.status)+" Content-Type "+res.getheader("content-type"))
+            print("giving up")
+            res.release_conn()
+            return None
+
+    def get_mplane_stream(self, url=None, postmsg=None):
+        """
+        As get_mplane_reply(), but returns an mplane.model.MessageStream
+        reading the reply incrementally from the connection: the message
+        header is available immediately, and result rows can be iterated
+        without holding the whole reply in memory.
+
+        """
+        res = self._mplane_request(url, postmsg, ACCEPT_JSON)
         if res.status == 200 and \
-           res.getheader("content-type") == "application/x-mplane+json":
+           res.getheader("content-type") == mplane.model.MIME_JSON:
             print("parsing json")
-            return mplane.model.parse_json(res.data.decode("utf-8"))
+            return mplane.model.parse_json_stream(_stream_body(res))
         else:
             print("giving up")
+            res.release_conn()
             return None
 
+    def _mplane_request(self, url, postmsg, accept, wait=None):
+        headers = {"accept": accept}
+        if wait:
+            headers["prefer"] = "wait="+str(int(wait))
+        if postmsg is not None:
+            print(postmsg)
+            if url is None:
+                url = "/"
+            if self._post_binary:
+                body = mplane.model.unparse_binary(postmsg)
+                headers["content-type"] = mplane.model.MIME_BINARY
+            else:
+                body = mplane.model.unparse_json(postmsg).encode("utf-8")
+                headers["content-type"] = mplane.model.MIME_JSON
+            res = self.pool.urlopen('POST', url, body=body, headers=headers,
+                                    preload_content=False)
+        else:
+            res = self.pool.request('GET', url, headers=headers, 
+                                    preload_content=False)
+        print("get_mplane_reply "+url+" "+str(res.status)+" Content-Type "+str(res.getheader("content-type")))
+        return res
+
     def handle_message(self, msg):
         """
         Processes a message. Caches capabilities, receipts, 
@@ -200,17 +263,57 @@ class HttpClient(object):
         if msg.get_token() not in [receipt.get_token() for receipt in self.receipts()]:
             self._receipts.append(msg)
 
-    def redeem_receipt(self, msg):
-        self.handle_message(self.get_mplane_reply(postmsg=mplane.model.Redemption(receipt=msg)))
+    def redeem_receipt(self, msg, wait=None, projection=None, filters=None):
+        """
+        Redeem a receipt. If a partial result is held for it, only the
+        rows after those held are requested, and appended to it.
+
+        If projection (a list of result column names) or filters 
+        (a list of (column name, operator, value) tuples) are given,
+        the component returns only those columns, and only rows passing
+        every filter; see mplane.model.Result.select(). Use the same 
+        projection and filters for each redemption of a receipt.
 
-    def redeem_receipts(self):
+        """
+        held = self._partial_result_for(msg.get_token())
+        cursor = None
+        if held is not None:
+            cursor = held.get_cursor()
+        redemption = mplane.model.Redemption(receipt=msg, cursor=cursor,
+                                             projection=projection, filters=filters)
+        reply = self.get_mplane_reply(postmsg=redemption, wait=wait)
+        if cursor is not None and isinstance(reply, mplane.model.Result):
+            held.append_result(reply)
+            held.set_cursor(reply.get_cursor())
+            held.set_partial(reply.is_partial())
+            held.set_when(reply.when(), force=True)
+            reply = held
+        self.handle_message(reply)
+
+    def _partial_result_for(self, token):
+        for result in self._results:
+            if result.get_token() == token and result.is_partial():
+                return result
+        return None
+
+    def redeem_receipts(self, wait=None):
         """
         Send all pending receipts to the Component,
-        attempting to retrieve results.
+        attempting to retrieve results. If wait is given, 
+        the Component holds each redemption for up to wait 
+        seconds until its result is available.
+
+        """
+        for receipt in list(self.receipts()):
+            self.redeem_receipt(receipt, wait=wait)
 
+    def interrupt_receipt(self, msg):
         """
-        for receipt in self.receipts():
-            self.redeem_receipt(receipt)
+        Interrupt the measurement for a pending receipt, 
+        retrieving its partial result if the Component has it.
+
+        """
+        self.handle_message(self.get_mplane_reply(postmsg=mplane.model.Interrupt(specification=msg)))
 
     def _delete_receipt_for(self, token):
         self._receipts = list(filter(lambda msg: msg.get_token() != token, self._receipts))
@@ -220,10 +323,23 @@ class HttpClient(object):
         yield from self._results
 
     def add_result(self, msg):
-        """Add a receipt. Check for duplicates."""
-        if msg.get_token() not in [result.get_token() for result in self.results()]:
+        """
+        Add a result. Check for duplicates. A partial result replaces 
+        an earlier partial result for the same measurement, and keeps
+        its receipt pending.
+
+        """
+        token = msg.get_token()
+        for (i, result) in enumerate(self._results):
+            if result.get_token() == token:
+                if not result.is_partial() and result is not msg:
+                    return
+                self._results[i] = msg
+                break
+        else:
             self._results.append(msg)
-            self._delete_receipt_for(msg.get_token())
+        if not msg.is_partial():
+            self._delete_receipt_for(token)
 
     def measurements(self):
         """Iterate over all measurements (receipts and results)"""
@@ -378,10 +494,34 @@ class ClientShell(cmd.Cmd):
         print("ok")
 
     def do_redeem(self, arg):
-        """Attempt to redeem all outstanding receipts"""
-        self._client.redeem_receipts()
+        """
+        Attempt to redeem all outstanding receipts. 
+        Usage: redeem [wait-seconds]
+
+        """
+        if arg:
+            self._client.redeem_receipts(wait=int(arg))
+        else:
+            self._client.redeem_receipts()
         print("ok")
 
+    def do_interrupt(self, arg):
+        """
+        Interrupt a pending measurement given a measurement index.
+        Usage: interrupt <measurement-index>
+
+        """
+        try:
+            meas = list(self._client.measurements())[int(arg.split()[0])]
+        except:
+            print("No such measurement "+arg)
+            return
+        if isinstance(meas, mplane.model.Receipt):
+            self._client.interrupt_receipt(meas)
+            print("ok")
+        else:
+            print("Measurement "+arg+" already complete")
+
     def do_show(self, arg):
         """Show a default parameter value, or all values if no parameter name given"""
         if len(arg) > 0:
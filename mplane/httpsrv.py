@@ -22,28 +22,67 @@
 #
 
 import tornado.web
+import tornado.gen
 import tornado.httpserver
 import ssl
 import os.path
 import mplane.model
 import mplane.sec
 import mplane.utils
-from datetime import datetime
-import time
-
-SLEEP_QUANTUM = 0.250
+from datetime import timedelta
+import re
 CAPABILITY_PATH_ELEM = "capability"
 
+# longest a client may ask for a redemption to be held, in ms
+MAX_WAIT_MS = 60000
+
+_prefer_wait_re = re.compile(r"(?:^|[,;\s])wait\s*=\s*(\d+)")
+
 class MPlaneHandler(tornado.web.RequestHandler):
     """
     Abstract tornado RequestHandler that allows a 
     handler to respond with an mPlane Message.
 
     """
+    def _accepts_binary(self):
+        """
+        Return True if the request's Accept header prefers the mPlane
+        binary encoding to JSON.
+
+        """
+        prefs = {}
+        for item in self.request.headers.get("Accept", "").split(","):
+            parts = item.split(";")
+            q = 1.0
+            for param in parts[1:]:
+                (k, sep, v) = param.strip().partition("=")
+                if k == "q":
+                    try:
+                        q = float(v)
+                    except ValueError:
+                        q = 0.0
+            prefs[parts[0].strip()] = q
+        return prefs.get(mplane.model.MIME_BINARY, 0) > \
+               prefs.get(mplane.model.MIME_JSON, 0)
+
+    @tornado.gen.coroutine
     def _respond_message(self, msg):
+        """
+        Write a message in the encoding negotiated via the Accept header.
+        JSON is written by flushing each chunk produced by
+        mplane.model.unparse_json_stream() before generating the next,
+        so large Results are never held in memory as a single string.
+
+        """
         self.set_status(200)
-        self.set_header("Content-Type", "application/x-mplane+json")
-        self.write(mplane.model.unparse_json(msg))
+        if self._accepts_binary():
+            self.set_header("Content-Type", mplane.model.MIME_BINARY)
+            self.write(mplane.model.unparse_binary(msg))
+        else:
+            self.set_header("Content-Type", mplane.model.MIME_JSON)
+            for chunk in mplane.model.unparse_json_stream(msg):
+                self.write(chunk)
+                yield self.flush()
         self.finish()
 
 class DiscoveryHandler(MPlaneHandler):
@@ -63,6 +102,7 @@ class DiscoveryHandler(MPlaneHandler):
             self.user = None
         self.scheduler = scheduler
 
+    @tornado.gen.coroutine
     def get(self):
         # capabilities
         path = self.request.path.split("/")[1:]
@@ -70,7 +110,7 @@ class DiscoveryHandler(MPlaneHandler):
             if (len(path) == 1 or path[1] is None):
                 self._respond_capability_links()
             else:
-                self._respond_capability(path[1])
+                yield self._respond_capability(path[1])
         else:
             # FIXME how do we tell tornado we don't want to handle this?
             raise ValueError("I only know how to handle /"+CAPABILITY_PATH_ELEM+" URLs via HTTP GET")
@@ -86,17 +126,23 @@ class DiscoveryHandler(MPlaneHandler):
         self.finish()
 
     def _respond_capability(self, key):
-        self._respond_message(self.scheduler.capability_for_key(key))
+        return self._respond_message(self.scheduler.capability_for_key(key))
 
 class MessagePostHandler(MPlaneHandler):
     """
     Receives mPlane messages POSTed from a client, and passes them to a 
     scheduler for processing. After waiting for a specified delay to see 
     if a Result is immediately available, returns a receipt for future
-    redemption.
+    redemption. The IOLoop continues to serve other requests while
+    waiting.
+
+    Redemptions are likewise held until the Result is available, for 
+    as long as the client asks with a "Prefer: wait=<seconds>" header
+    (RFC 7240), up to max_wait_ms. Interrupts are held for the same 
+    delay as specifications, to return the partial Result.
 
     """
-    def initialize(self, scheduler, immediate_ms = 5000):
+    def initialize(self, scheduler, immediate_ms = 5000, max_wait_ms = MAX_WAIT_MS):
         if scheduler.ac.security == True:
             for elem in self.request.get_ssl_certificate().get('subject'):
                 if elem[0][0] == 'commonName':
@@ -105,6 +151,15 @@ class MessagePostHandler(MPlaneHandler):
             self.user = None
         self.scheduler = scheduler
         self.immediate_ms = immediate_ms
+        self.max_wait_ms = max_wait_ms
+
+    def _preferred_wait_ms(self):
+        """Return the wait in milliseconds requested with a Prefer header"""
+        for value in self.request.headers.get_list("Prefer"):
+            m = _prefer_wait_re.search(value)
+            if m is not None:
+                return min(int(m.group(1)) * 1000, self.max_wait_ms)
+        return 0
 
     def get(self):
         # message
@@ -120,31 +175,53 @@ class MessagePostHandler(MPlaneHandler):
         self.write("</body></html>")
         self.finish()
 
+    @tornado.gen.coroutine
     def post(self):
-        # unwrap json message from body
-        if (self.request.headers["Content-Type"] == "application/x-mplane+json"):
-            msg = mplane.model.parse_json(self.request.body.decode("utf-8"))
-        else:
+        # unwrap json or binary message from body
+        content_type = self.request.headers["Content-Type"].split(";")[0].strip()
+        if content_type not in (mplane.model.MIME_JSON, mplane.model.MIME_BINARY):
             # FIXME how do we tell tornado we don't want to handle this?
-            raise ValueError("I only know how to handle mPlane JSON messages via HTTP POST")
+            raise ValueError("I only know how to handle mPlane JSON or binary messages via HTTP POST")
+        try:
+            if content_type == mplane.model.MIME_JSON:
+                msg = mplane.model.parse_json(self.request.body.decode("utf-8"))
+            else:
+                msg = mplane.model.parse_binary(self.request.body)
+        except ValueError as e:
+            # refuse malformed messages with an mPlane exception
+            yield self._respond_message(mplane.model.Exception(
+                        errmsg="Malformed mPlane message: "+str(e)))
+            return
 
         # hand message to scheduler
         reply = self.scheduler.receive_message(self.user, msg)
 
-        # wait for immediate delay
-        if self.immediate_ms > 0 and \
-           isinstance(msg, mplane.model.Specification) and \
-           isinstance(reply, mplane.model.Receipt):
+        # wait for immediate delay, or as long as the client asked
+        wait_ms = 0
+        if isinstance(msg, (mplane.model.Specification, mplane.model.Interrupt)):
+            wait_ms = self.immediate_ms
+        elif isinstance(msg, mplane.model.Redemption):
+            wait_ms = self._preferred_wait_ms()
+            if wait_ms > 0:
+                self.set_header("Preference-Applied", "wait="+str(wait_ms // 1000))
+
+        pending = isinstance(reply, mplane.model.Receipt) or \
+                  (isinstance(reply, mplane.model.Result) and reply.is_partial())
+        if wait_ms > 0 and pending:
             job = self.scheduler.job_for_message(reply)
-            wait_start = datetime.utcnow()
-            while (datetime.utcnow() - wait_start).total_seconds() * 1000 < self.immediate_ms:
-                time.sleep(SLEEP_QUANTUM)
-                if job.failed() or job.finished():
+            try:
+                yield tornado.gen.with_timeout(
+                        timedelta(milliseconds=wait_ms), 
+                        job.completion())
+                if isinstance(msg, mplane.model.Redemption):
+                    reply = self.scheduler.redeem(job, msg)
+                else:
                     reply = job.get_reply()
-                    break
+            except tornado.gen.TimeoutError:
+                pass
 
         # return reply
-        self._respond_message(reply)
+        yield self._respond_message(reply)
 
 # FIXME build a class that wraps a scheduler and a runloop (and maybe a command line interpreter)
 
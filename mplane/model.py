@@ -244,16 +244,25 @@ results:
 
 """
 
-from ipaddress import ip_address
+from ipaddress import ip_address, IPv4Address, IPv6Address
 from datetime import datetime, timedelta, timezone
 from copy import copy, deepcopy
 import urllib.request
+import urllib.error
+import urllib.parse
 import collections
 import functools
+import itertools
 import operator
 import hashlib
+import codecs
+import struct
+import marshal
+import sys
 import json
 import yaml
+import threading
+import time
 import re
 import os
 
@@ -295,6 +304,32 @@ KEY_SCHEDULE = "schedule"
 KEY_REGISTRY = "registry"
 KEY_LABEL = "label"
 KEY_CONTENTS = "contents"
+KEY_CURSOR = "cursor"
+KEY_PARTIAL = "partial"
+KEY_PROJECTION = "projection"
+KEY_FILTER = "filter"
+
+_filter_ops = { "==": operator.eq, "!=": operator.ne, 
+                "<": operator.lt, "<=": operator.le, 
+                ">": operator.gt, ">=": operator.ge }
+
+def _check_filter(f):
+    """
+    Check that a row filter is a (column name, operator, value) triple
+    with a string column name, a known operator, and a scalar value;
+    return it as a tuple, or raise ValueError.
+
+    """
+    if not isinstance(f, (list, tuple)) or len(f) != 3:
+        raise ValueError("Filter must be [column, operator, value]: "+repr(f))
+    (name, op, val) = f
+    if not isinstance(name, str):
+        raise ValueError("Filter column name must be a string: "+repr(name))
+    if not isinstance(op, str) or op not in _filter_ops:
+        raise ValueError("Unknown filter operator "+repr(op))
+    if val is None or isinstance(val, (list, tuple, dict, set)):
+        raise ValueError("Filter value must be a scalar: "+repr(val))
+    return (name, op, val)
 
 KEY_MONTHS = "months"
 KEY_DAYS = "days"
@@ -342,6 +377,14 @@ MPLANE_VERSION = 0 # version 0 -- pre-D1.4 protocol, no interop guarantee
 # Hash length in __repr__ strings
 REPHL = 8
 
+# Environment variable naming the compiled registry snapshot directory
+REGCACHE_ENV = "MPLANE_REGISTRY_CACHE"
+# Compiled registry snapshot format version
+REGCACHE_FORMAT = 2
+# Seconds for which snapshots of remote registries are used 
+# before their sources are checked for changes
+REGCACHE_TTL = 3600
+
 EXCEPTION_NO_TOKEN = "00000000000000000000000000000000"
 
 #######################################################################
@@ -438,6 +481,10 @@ class PastTime:
     def __repr__(self):
         return "mplane.model.time_past"
 
+    def __reduce__(self):
+        # unpickle as the singleton
+        return "time_past"
+
     def strftime(self, ign):
         return str(self)
 
@@ -455,6 +502,10 @@ class NowTime:
     def __repr__(self):
         return "mplane.model.time_now"
 
+    def __reduce__(self):
+        # unpickle as the singleton
+        return "time_now"
+
     def strftime(self, ign):
         return str(self)
 
@@ -472,6 +523,10 @@ class FutureTime:
     def __repr__(self):
         return "mplane.model.time_future"
 
+    def __reduce__(self):
+        # unpickle as the singleton
+        return "time_future"
+
     def strftime(self, ign):
         return str(self)
 
@@ -498,6 +553,8 @@ class When(object):
     single measurement specifications.
 
     """
+    __slots__ = ('_a', '_b', '_d', '_p')
+
     def __init__(self, valstr=None, a=None, b=None, d=None, p=None):
         super().__init__()
         self._a = a
@@ -739,6 +796,9 @@ class When(object):
 
 when_infinite = When(a=time_past, b=time_future)
 
+# the Gregorian calendar repeats every 400 years
+_CALENDAR_CYCLE = timedelta(days=146097)
+
 class Schedule(object):
     """
     Defines a schedule for repeated operations based on crontab-like
@@ -815,17 +875,90 @@ class Schedule(object):
         if KEY_SECONDS in d:
             self._seconds = _parse_numset(d[KEY_SECONDS])
 
+    def _matches_time(self, t):
+        """Return True if the time of day of t matches this schedule"""
+        return (not self._seconds or t.second in self._seconds) and \
+               (not self._minutes or t.minute in self._minutes) and \
+               (not self._hours or t.hour in self._hours)
+
+    def _matches(self, t):
+        """Return True if datetime t matches every cron set of this schedule"""
+        return self._matches_time(t) and \
+               (not self._days or t.day in self._days) and \
+               (not self._weekdays or t.weekday() in self._weekdays) and \
+               (not self._months or t.month in self._months)
+
+    def next_match(self, t, end=None):
+        """
+        Return the first datetime at or after t matching every cron set
+        of this schedule, or None if there is no such datetime before 
+        end (or at all). Jumps directly to the next matching month, day,
+        hour, minute, and second instead of stepping through time.
+
+        """
+        if self._matches(t):
+            return t
+
+        # sorted candidates for each field, ignoring out-of-range values
+        months = sorted(m for m in self._months if 1 <= m <= 12)
+        hours = sorted(h for h in self._hours if 0 <= h <= 23)
+        minutes = sorted(m for m in self._minutes if 0 <= m <= 59)
+        seconds = sorted(s for s in self._seconds if 0 <= s <= 59)
+
+        # every combination of days recurs within 400 years
+        limit = t.year + 400
+        day = timedelta(days=1)
+        t = t.replace(microsecond=0)
+        try:
+            while (end is None or t <= end) and t.year <= limit:
+                if self._months and t.month not in self._months:
+                    m = next((m for m in months if m > t.month), None)
+                    if m is None:
+                        if not months:
+                            return None
+                        t = datetime(t.year + 1, months[0], 1)
+                    else:
+                        t = datetime(t.year, m, 1)
+                elif (self._days and t.day not in self._days) or \
+                     (self._weekdays and t.weekday() not in self._weekdays):
+                    t = datetime(t.year, t.month, t.day) + day
+                elif self._hours and t.hour not in self._hours:
+                    h = next((h for h in hours if h > t.hour), None)
+                    if h is None:
+                        t = datetime(t.year, t.month, t.day) + day
+                    else:
+                        t = t.replace(hour=h, minute=0, second=0)
+                elif self._minutes and t.minute not in self._minutes:
+                    m = next((m for m in minutes if m > t.minute), None)
+                    if m is None:
+                        t = t.replace(minute=0, second=0) + timedelta(hours=1)
+                    else:
+                        t = t.replace(minute=m, second=0)
+                elif self._seconds and t.second not in self._seconds:
+                    s = next((s for s in seconds if s > t.second), None)
+                    if s is None:
+                        t = t.replace(second=0) + timedelta(minutes=1)
+                    else:
+                        t = t.replace(second=s)
+                else:
+                    return t
+        except OverflowError:
+            pass
+        return None
+
     def datetime_iterator(self, t=None):
         """
         Returns an iterator over datetimes generated by the schedule 
-        and period. 
+        and period: every time t + n * period within the temporal scope
+        which matches the schedule. The scope is evaluated once, 
+        when the iterator is created.
 
         """
-        # default to now, zero microseconds, initialize minus one second
+        # default to now, zero microseconds
         if t is None:
             t = datetime.utcnow().replace(microsecond=0)
 
-        # get base period (default 1s) and
+        # get base period (default 1s)
         period = None
         if self._when is not None:
             period = self._when.period()
@@ -833,29 +966,75 @@ class Schedule(object):
             period = timedelta(seconds=1)
 
         # fast forward if necessary
-        lag = self._when.sort_scope(t)
-        if lag < 0:
-            t += timedelta(seconds=-lag)
-
-        # loop through time by period and check for match
-        t -= period
+        end = None
+        if self._when is not None:
+            (start, end) = self._when.datetimes()
+            if start is not None and t < start:
+                t = start
+
+        # a period of whole days keeps the time of day of the start
+        base = t
+        if period % timedelta(days=1) == timedelta(0) and \
+           not self._matches_time(base):
+            return
+
+        # jump to the next match, then round up to the next period;
+        # the calendar repeats every 400 years, so if rounding finds no
+        # match within that long of the last one, it never will
+        last = base
         while True:
-            t += period
-            if self._when is not None and not self._when.in_scope(t):
-                break
-            if len(self._seconds) and (t.second not in self._seconds):
-                continue
-            if len(self._minutes) and (t.minute not in self._minutes):
-                continue
-            if len(self._hours) and (t.hour not in self._hours):
-                continue
-            if len(self._days) and (t.day not in self._days):
-                continue
-            if len(self._weekdays) and (t.weekday() not in self._weekdays):
-                continue
-            if len(self._months) and (t.month not in self._months):
-                continue
-            yield t
+            t = self.next_match(t, end)
+            if t is None:
+                return
+            t = base - ((base - t) // period) * period
+            if end is not None and t > end:
+                return
+            if t - last > _CALENDAR_CYCLE:
+                return
+            if self._matches(t):
+                yield t
+                last = t
+                t += period
+
+def test_schedule():
+    """Test Schedule"""
+    t0 = datetime(2013, 6, 1)
+    sched = Schedule(dictval={KEY_WHEN: "2014-01-01 00:00:00 ... 2016-01-01 00:00:00",
+                              KEY_DAYS: "1", KEY_HOURS: "3"})
+    times = list(itertools.islice(sched.datetime_iterator(t0), 3601))
+    assert times[0] == datetime(2014, 1, 1, 3, 0, 0)
+    assert times[3599] == datetime(2014, 1, 1, 3, 59, 59)
+    assert times[3600] == datetime(2014, 2, 1, 3, 0, 0)
+    assert all(t.day == 1 and t.hour == 3 for t in times)
+
+    # sparse schedule: monday 29 february
+    sched = Schedule(dictval={KEY_WHEN: "2014-01-01 00:00:00 ... future",
+                              KEY_MONTHS: "2", KEY_DAYS: "29", KEY_WEEKDAYS: "mo",
+                              KEY_HOURS: "12", KEY_MINUTES: "30", KEY_SECONDS: "15"})
+    assert next(sched.datetime_iterator(t0)) == datetime(2016, 2, 29, 12, 30, 15)
+
+    # period applies from the start of the scope, matches are rounded up
+    sched = Schedule(dictval={KEY_WHEN: "2014-01-01 00:00:00 ... 2014-01-01 01:00:00 / 7s",
+                              KEY_MINUTES: "10,11"})
+    times = list(sched.datetime_iterator(t0))
+    assert times[0] == datetime(2014, 1, 1, 0, 10, 2)
+    assert all((t - datetime(2014, 1, 1)).seconds % 7 == 0 for t in times)
+    assert len(times) == 17
+
+    # impossible schedules end
+    sched = Schedule(dictval={KEY_WHEN: "2014-01-01 00:00:00 ... future",
+                              KEY_MONTHS: "2", KEY_DAYS: "30"})
+    assert list(sched.datetime_iterator(t0)) == []
+
+    # as do schedules the period never lines up with
+    other_hour = str((datetime.utcnow().hour + 12) % 24)
+    for (when, crons) in (("now ... future / 1d", {KEY_HOURS: other_hour}),
+                          ("2014-01-01 00:00:00 ... future / 1d", {KEY_HOURS: "3"}),
+                          ("2014-01-01 00:00:00 ... future / 7d", {KEY_WEEKDAYS: "mo"})):
+        crons[KEY_WHEN] = when
+        start = time.monotonic()
+        assert list(Schedule(dictval=crons).datetime_iterator()) == []
+        assert time.monotonic() - start < 5
 
 def test_tscope():
     """Test When"""
@@ -908,6 +1087,8 @@ class Primitive(object):
     the Statement and Notification classes.
 
     """
+    __slots__ = ('name',)
+
     def __init__(self, name):
         super().__init__()
         self.name = name
@@ -950,6 +1131,8 @@ class StringPrimitive(Primitive):
     in general, however, this is used internally by Element.
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("string")
 
@@ -965,6 +1148,8 @@ class NaturalPrimitive(Primitive):
     in general, however, this is used internally by Element.
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("natural")
 
@@ -988,6 +1173,8 @@ class RealPrimitive(Primitive):
     in general, however, this is used internally by Element.
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("real")
     
@@ -1010,6 +1197,8 @@ class BooleanPrimitive(Primitive):
     in general, however, this is used internally by Element.
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("boolean")
 
@@ -1042,6 +1231,8 @@ class AddressPrimitive(Primitive):
     for the native representation. 
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("address")
     
@@ -1061,6 +1252,8 @@ class URLPrimitive(Primitive):
     without any parsing or validation.
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("url")
 
@@ -1073,6 +1266,8 @@ class TimePrimitive(Primitive):
     Also handles special-purpose mPlane timestamps.
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("time")
     
@@ -1149,6 +1344,8 @@ class Element(object):
     elements; use initialize_registry() to use these.
 
     """
+    __slots__ = ('_name', '_prim', '_desc', '_qualname')
+
     def __init__(self, name, prim, desc=None, namespace=REGURI_DEFAULT):
         super().__init__()
         self._name = name
@@ -1156,6 +1353,17 @@ class Element(object):
         self._desc = desc
         self._qualname = namespace + ANCHOR_SEP + name
 
+    def _share_element(self, elem):
+        """
+        Take the name, primitive, and description of another Element 
+        (generally from the registry) by reference, without rebuilding them.
+
+        """
+        self._name = elem._name
+        self._prim = elem._prim
+        self._desc = elem._desc
+        self._qualname = elem._qualname
+
     def __str__(self):
         return self._name
 
@@ -1216,24 +1424,52 @@ class Registry(object):
     A Registry is a collection of named Elements associated with a
     namespace URI, from which it is retrieved.
 
+    If cache is True, the registry is loaded from a compiled snapshot 
+    in registry_cache_dir() if one exists for its URI, and the snapshot 
+    is written after parsing otherwise. A snapshot holds the registry 
+    and all its includes already resolved; Elements are only built from 
+    it when first looked up. 
+
+    A snapshot is rebuilt when any local file it was built from (the 
+    built-in registry.json, or a file: URI) changes. Remote sources 
+    are checked once the snapshot is older than REGCACHE_TTL seconds, 
+    with a conditional request using the ETag and Last-Modified headers
+    they were served with; a remote source served without either is 
+    fetched again. refresh=True reparses the registry in any case.
+
     """
 
-    def __init__(self, uri=REGURI_DEFAULT, parse=True):
+    def __init__(self, uri=REGURI_DEFAULT, parse=True, cache=False, refresh=False):
         super().__init__()
         self._revision = None
         self._elements = collections.OrderedDict()
         self._namespaces = set()
+        self._sources = collections.OrderedDict()
+        self._cache = cache
 
         # stash URI and parse the registry
         self._uri = uri
         if parse:
-            self._parse_from_uri(self._uri)
+            if not cache or refresh or not self._load_snapshot():
+                self._parse_from_uri(self._uri)
+                if cache:
+                    self._save_snapshot()
 
     def __len__(self):
         return len(self._elements)
 
     def __getitem__(self, name):
-        return self._elements[name]
+        elem = self._elements[name]
+        if elem.__class__ is tuple:
+            # build elements loaded from a snapshot on first use
+            (name, prim, desc, namespace) = elem
+            elem = Element(name, _prim[prim], desc, namespace)
+            self._elements[name] = elem
+        return elem
+
+    def revision(self):
+        """Return the revision of this registry"""
+        return self._revision
 
     def _add_element(self, elem):
         self._elements[elem.name()] = elem
@@ -1249,9 +1485,6 @@ class Registry(object):
         if d[KEY_REGFMT] != REGFMT_FLAT:
             raise ValueError("Unsupported registry format "+str(d[KEY_REGFMT]))
 
-        # stash revision
-        self._revision = int(d[KEY_REGREV])
-
         # get namespace and check for loops
         namespace = d[KEY_REGURI]
 
@@ -1264,6 +1497,9 @@ class Registry(object):
             for incuri in d[KEY_REGINCLUDE]:
                 self._parse_from_uri(incuri)
 
+        # stash revision after includes, so the including registry's wins
+        self._revision = int(d[KEY_REGREV])
+
         # finally, iterate over elements and add them to the table
         for elem in d[KEY_ELEMENTS]:
             name = elem[KEY_ELEMNAME]
@@ -1276,19 +1512,94 @@ class Registry(object):
 
     def _parse_from_uri(self, uri):
         if uri == REGURI_DEFAULT:
-            with open(os.path.join(os.path.dirname(__file__), "registry.json"), "r") as stream:
+            with open(_default_registry_path(), "r") as stream:
+                self._sources[uri] = _source_stamp(uri)
                 self._parse_json_bytestream(stream)
         else:
             with urllib.request.urlopen(uri) as stream:
+                self._sources[uri] = _source_stamp(uri, stream)
                 self._parse_json_bytestream(stream)
 
+    def _snapshot_path(self):
+        cachedir = registry_cache_dir()
+        if cachedir is None:
+            return None
+        return os.path.join(cachedir, "registry-"+
+                 hashlib.md5(self._uri.encode("utf-8")).hexdigest()+".snap")
+
+    def _load_snapshot(self):
+        """
+        Fill in this registry from its compiled snapshot. 
+        Returns False if there is no usable snapshot.
+
+        """
+        path = self._snapshot_path()
+        if path is None:
+            return False
+        try:
+            with open(path, "rb") as stream:
+                age = time.time() - os.fstat(stream.fileno()).st_mtime
+                (fmt, uri, sources, revision, namespaces, elements) = \
+                        marshal.loads(stream.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+
+        if fmt != REGCACHE_FORMAT or uri != self._uri:
+            return False
+
+        # local sources are always checked, remote ones after REGCACHE_TTL
+        remote = []
+        for (srcuri, stamp) in sources:
+            if _source_path(srcuri) is None:
+                remote.append((srcuri, stamp))
+            elif not _source_current(srcuri, stamp):
+                return False
+        if len(remote) and age >= REGCACHE_TTL:
+            for (srcuri, stamp) in remote:
+                if not _source_current(srcuri, stamp):
+                    return False
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        self._sources = collections.OrderedDict(sources)
+        self._revision = revision
+        self._namespaces = set(namespaces)
+        self._elements = collections.OrderedDict((e[0], e) for e in elements)
+        return True
+
+    def _save_snapshot(self):
+        """
+        Write a compiled snapshot of this registry. Failure to write 
+        the snapshot (e.g. in a read-only home directory) is not an error.
+
+        """
+        path = self._snapshot_path()
+        if path is None:
+            return
+        elements = tuple((elem.name(), elem.primitive_name(), elem.desc(),
+                          elem.qualified_name().rsplit(ANCHOR_SEP, 1)[0])
+                         for elem in map(self.__getitem__, self._elements))
+        snap = marshal.dumps((REGCACHE_FORMAT, self._uri, tuple(self._sources.items()),
+                              self._revision, tuple(self._namespaces), elements))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmppath = path + "." + str(os.getpid())
+            with open(tmppath, "wb") as stream:
+                stream.write(snap)
+            os.replace(tmppath, path)
+        except OSError as e:
+            print("Cannot write registry snapshot "+path+": "+str(e))
+
     def _dump_json(self):
         d = collections.OrderedDict()
         d[KEY_REGFMT] = REGFMT_FLAT
         d[KEY_REGREV] = int(self._revision)
         d[KEY_REGURI] = self._uri
         d[KEY_ELEMENTS] = []
-        for elem in self._elements.values():
+        for name in self._elements:
+            elem = self[name]
             ed = collections.OrderedDict()
             ed[KEY_ELEMNAME] = elem.name()
             ed[KEY_ELEMPRIM] = elem.primitive_name()
@@ -1299,19 +1610,191 @@ class Registry(object):
 
         return json.dumps(d, indent=4)
 
+def _default_registry_path():
+    return os.path.join(os.path.dirname(__file__), "registry.json")
+
+def _source_path(uri):
+    # local path of a registry source, or None for remote sources
+    if uri == REGURI_DEFAULT:
+        return _default_registry_path()
+    parts = urllib.parse.urlparse(uri)
+    if parts.scheme == "file":
+        return urllib.request.url2pathname(parts.path)
+    return None
+
+def _source_stamp(uri, stream=None):
+    """
+    Identify the version of a registry source: the modification time 
+    and size of a local file, or the ETag and Last-Modified headers 
+    of the response a remote source was read from (None if it has 
+    neither).
+
+    """
+    path = _source_path(uri)
+    if path is not None:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    headers = getattr(stream, "headers", None)
+    if headers is None:
+        return None
+    stamp = (headers.get("ETag"), headers.get("Last-Modified"))
+    if stamp == (None, None):
+        return None
+    return stamp
+
+def _source_current(uri, stamp):
+    """
+    Return True if a registry source is unchanged since stamped by 
+    _source_stamp(). Remote sources are checked with a conditional 
+    request; a source which answers with an HTTP error is taken to have
+    changed, and one which cannot be reached at all is assumed unchanged.
+
+    """
+    if _source_path(uri) is not None:
+        try:
+            return _source_stamp(uri) == stamp
+        except OSError:
+            return False
+    if stamp is None:
+        return False
+
+    (etag, modified) = stamp
+    request = urllib.request.Request(uri)
+    if etag is not None:
+        request.add_header("If-None-Match", etag)
+    if modified is not None:
+        request.add_header("If-Modified-Since", modified)
+    try:
+        with urllib.request.urlopen(request) as stream:
+            return _source_stamp(uri, stream) == stamp
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return True
+        print("Registry source "+uri+" failed: "+str(e))
+        return False
+    except (urllib.error.URLError, OSError) as e:
+        print("Cannot check registry source "+uri+": "+str(e))
+        return True
+
+def registry_cache_dir():
+    """
+    Return the directory holding compiled registry snapshots: 
+    the value of the MPLANE_REGISTRY_CACHE environment variable if set,
+    or mplane in the user's cache directory. Returns None if 
+    MPLANE_REGISTRY_CACHE is set but empty, disabling snapshots.
+
+    """
+    cachedir = os.environ.get(REGCACHE_ENV)
+    if cachedir is not None:
+        return cachedir or None
+    basedir = os.environ.get("XDG_CACHE_HOME") or \
+              os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(basedir, "mplane")
+
 _registry = None
 
-def initialize_registry(uri=REGURI_DEFAULT):
+def initialize_registry(uri=REGURI_DEFAULT, cache=False, refresh=False):
     """
     Initializes the mPlane registry from a URI; if no URI is given,
     initializes the registry from the internal core registry.
+
+    If cache is True, the registry is loaded from a compiled snapshot 
+    if a current one is available (see :class:`mplane.model.Registry`);
+    refresh=True reparses the registry and its includes from their
+    sources and replaces the snapshot.
+
     """
     global _registry
-    _registry = Registry(uri)
+    _registry = Registry(uri, cache=cache, refresh=refresh)
 
 def element(name):
     return _registry[name]
 
+def test_registry_snapshot():
+    """Test compiled registry snapshots"""
+    import tempfile
+    import http.server
+    import threading
+    olddir = os.environ.get(REGCACHE_ENV)
+    with tempfile.TemporaryDirectory() as cachedir:
+        os.environ[REGCACHE_ENV] = cachedir
+        try:
+            # snapshots are opt-in
+            assert not os.path.exists(Registry()._snapshot_path())
+            reg = Registry(cache=True)
+            assert os.path.exists(reg._snapshot_path())
+            sreg = Registry(cache=True)
+            assert len(sreg) == len(reg)
+            assert sreg.revision() == reg.revision()
+            assert sreg._elements["delay.twoway.icmp.us"].__class__ is tuple
+            assert repr(sreg["delay.twoway.icmp.us"]) == \
+                   repr(reg["delay.twoway.icmp.us"])
+            assert sreg._dump_json() == reg._dump_json()
+
+            # stale snapshots are ignored
+            with open(reg._snapshot_path(), "wb") as stream:
+                stream.write(marshal.dumps((REGCACHE_FORMAT, reg._uri, 
+                                            ((REGURI_DEFAULT, None),), 0, (), ())))
+            assert len(Registry(cache=True)) == len(reg)
+            with open(reg._snapshot_path(), "wb") as stream:
+                stream.write(b"garbage")
+            assert len(Registry(cache=True)) == len(reg)
+
+            # snapshots of local files are rebuilt when they change
+            regpath = os.path.join(cachedir, "test.json")
+            def write_registry(revision):
+                with open(regpath, "w") as stream:
+                    json.dump({KEY_REGFMT: REGFMT_FLAT, KEY_REGREV: revision,
+                               KEY_REGURI: "http://example.com/test.json",
+                               KEY_REGINCLUDE: [REGURI_DEFAULT],
+                               KEY_ELEMENTS: []}, stream)
+                # whole seconds apart, for Last-Modified
+                t = time.time() + revision * 10
+                os.utime(regpath, (t, t))
+            write_registry(1)
+            fileuri = "file://" + urllib.request.pathname2url(regpath)
+            assert Registry(fileuri, cache=True).revision() == 1
+            assert Registry(fileuri, cache=True)._elements["start"].__class__ is tuple
+            write_registry(2)
+            assert Registry(fileuri, cache=True).revision() == 2
+
+            # remote sources are checked after REGCACHE_TTL
+            handler = functools.partial(http.server.SimpleHTTPRequestHandler,
+                                        directory=cachedir)
+            server = http.server.HTTPServer(("127.0.0.1", 0), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                httpuri = "http://127.0.0.1:%u/test.json" % server.server_port
+                hreg = Registry(httpuri, cache=True)
+                assert hreg.revision() == 2
+                write_registry(3)
+                assert Registry(httpuri, cache=True).revision() == 2
+                expired = time.time() - REGCACHE_TTL
+                os.utime(hreg._snapshot_path(), (expired, expired))
+                assert Registry(httpuri, cache=True).revision() == 3
+                os.utime(hreg._snapshot_path(), (expired, expired))
+                sreg = Registry(httpuri, cache=True)
+                assert sreg.revision() == 3
+                assert sreg._elements["start"].__class__ is tuple
+                assert os.stat(hreg._snapshot_path()).st_mtime > expired
+
+                # failing sources are not served from the snapshot
+                os.utime(hreg._snapshot_path(), (expired, expired))
+                os.remove(regpath)
+                try:
+                    Registry(httpuri, cache=True)
+                    assert False, "loaded registry from removed source"
+                except urllib.error.HTTPError as e:
+                    assert e.code == 404
+            finally:
+                server.shutdown()
+                server.server_close()
+        finally:
+            if olddir is None:
+                del os.environ[REGCACHE_ENV]
+            else:
+                os.environ[REGCACHE_ENV] = olddir
+
 #######################################################################
 # Old registry methods
 #######################################################################
@@ -1398,6 +1881,8 @@ class Constraint(object):
     Constraint classes through Parameters.
 
     """
+    __slots__ = ('_prim',)
+
     def __init__(self, prim):
         super().__init__()
         self._prim = prim
@@ -1409,6 +1894,12 @@ class Constraint(object):
     def __repr__(self):
         return "mplane.model.constraint_all"
 
+    def __reduce_ex__(self, protocol):
+        # unpickle constraint_all as the singleton
+        if self is constraint_all:
+            return "constraint_all"
+        return super().__reduce_ex__(protocol)
+
     def met_by(self, val):
         """Determine if this constraint is met by a given value."""
         return True
@@ -1426,6 +1917,7 @@ constraint_all = Constraint(None)
 
 class RangeConstraint(Constraint):
     """Represents acceptable values for an element as an inclusive range"""
+    __slots__ = ('a', 'b')
 
     def __init__(self, prim, sval=None, a=None, b=None):
         super().__init__(prim)
@@ -1465,6 +1957,8 @@ class RangeConstraint(Constraint):
 
 class SetConstraint(Constraint):
     """Represents acceptable values as a discrete set."""
+    __slots__ = ('vs',)
+
     def __init__(self, prim, sval=None, vs=None):
         super().__init__(prim)
         if sval is not None:
@@ -1524,6 +2018,302 @@ def test_constraints():
     assert sc.met_by(ip_address('10.0.28.103'))
     assert not sc.met_by(ip_address('10.0.27.103'))
 
+#######################################################################
+# Columnar storage for result values
+#######################################################################
+
+_EPOCH = datetime(1970, 1, 1)
+_USEC = timedelta(microseconds=1)
+
+def _encode_natural(val):
+    if isinstance(val, int) and not isinstance(val, bool):
+        return val
+    raise TypeError("not a natural")
+
+def _encode_real(val):
+    if isinstance(val, (int, float)) and not isinstance(val, bool):
+        return float(val)
+    raise TypeError("not a real")
+
+def _encode_time(val):
+    if isinstance(val, datetime) and val.tzinfo is None:
+        return (val - _EPOCH) // _USEC
+    raise TypeError("not a naive datetime")
+
+def _decode_time(val):
+    return _EPOCH + timedelta(microseconds=val)
+
+def _encode_address(val):
+    if isinstance(val, (IPv4Address, IPv6Address)):
+        return (val.version, val.packed)
+    raise TypeError("not an address")
+
+def _decode_address(val):
+    (version, packed) = val
+    if version == 4:
+        return IPv4Address(packed[:4])
+    else:
+        return IPv6Address(packed)
+
+class _ColumnCodec(object):
+    """
+    Describes how the values of a primitive are packed into
+    fixed-width records within a typed column store.
+
+    """
+    def __init__(self, name, fmt, encode, decode=None, multi=False):
+        super().__init__()
+        self.name = name
+        self.record = struct.Struct(fmt)
+        self.width = self.record.size
+        self.encode = encode
+        self.decode = decode
+        self.multi = multi
+
+    def pack_into(self, buf, offset, val):
+        if self.multi:
+            self.record.pack_into(buf, offset, *val)
+        else:
+            self.record.pack_into(buf, offset, val)
+
+    def unpack_from(self, buf, offset):
+        val = self.record.unpack_from(buf, offset)
+        if not self.multi:
+            val = val[0]
+        if self.decode is not None:
+            val = self.decode(val)
+        return val
+
+    def __reduce__(self):
+        # unpickle as the shared codec for the primitive
+        return (_column_codec_for, (self.name,))
+
+_column_codec = { c.name: c for c in [
+                  _ColumnCodec(prim_natural.name, "<q", _encode_natural),
+                  _ColumnCodec(prim_real.name, "<d", _encode_real),
+                  _ColumnCodec(prim_time.name, "<q", _encode_time, _decode_time),
+                  _ColumnCodec(prim_address.name, "<B16s", _encode_address, 
+                               _decode_address, True)] }
+
+def _column_codec_for(name):
+    return _column_codec[name]
+
+class _ListColumnStore(object):
+    """
+    Column storage as a list of native values. Used for primitives
+    without a packed representation, and as a fallback for values a
+    typed store cannot hold (e.g. time_now in a time column).
+
+    """
+    def __init__(self, vals=None):
+        super().__init__()
+        if vals is None:
+            vals = []
+        self._vals = vals
+
+    def copy(self):
+        return _ListColumnStore(list(self._vals))
+
+    def slice(self, start, end):
+        return _ListColumnStore(self._vals[start:end])
+
+    def take(self, indices):
+        return _ListColumnStore([self._vals[i] for i in indices])
+
+    def __len__(self):
+        return len(self._vals)
+
+    def __iter__(self):
+        return iter(self._vals)
+
+    def get(self, i):
+        return self._vals[i]
+
+    def set(self, i, val):
+        self._vals[i] = val
+
+    def extend(self, vals):
+        self._vals.extend(vals)
+
+    def pad(self, count):
+        self._vals.extend([None] * count)
+
+    def delete(self, i):
+        del(self._vals[i])
+
+    def clear(self):
+        self._vals.clear()
+
+    def nbytes(self):
+        return sys.getsizeof(self._vals) + sum(map(sys.getsizeof, self._vals))
+
+class _TypedColumnStore(object):
+    """
+    Column storage as fixed-width packed records in a bytearray,
+    with a parallel presence mask for None values. The buffer grows 
+    by doubling, so appends are amortized constant time.
+
+    Raises TypeError or struct.error on values the codec cannot
+    represent; the owning ResultColumn then falls back to a list.
+
+    """
+    def __init__(self, codec):
+        super().__init__()
+        self._codec = codec
+        self._buf = bytearray()
+        self._present = bytearray()
+        self._len = 0
+
+    def copy(self):
+        other = copy(self)
+        other._buf = bytearray(self._buf)
+        other._present = bytearray(self._present)
+        return other
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def slice(self, start, end):
+        other = copy(self)
+        width = self._codec.width
+        other._buf = self._buf[start * width:end * width]
+        other._present = self._present[start:end]
+        other._len = len(other._present)
+        return other
+
+    def take(self, indices):
+        other = copy(self)
+        width = self._codec.width
+        buf = self._buf
+        other._buf = bytearray().join(buf[i * width:(i + 1) * width] for i in indices)
+        other._present = bytearray(self._present[i] for i in indices)
+        other._len = len(other._present)
+        return other
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self.get(i)
+
+    def _reserve(self, count):
+        cap = len(self._present)
+        if count <= cap:
+            return
+        newcap = max(cap * 2, count)
+        self._buf.extend(bytes((newcap - cap) * self._codec.width))
+        self._present.extend(bytes(newcap - cap))
+
+    def get(self, i):
+        if not self._present[i]:
+            return None
+        return self._codec.unpack_from(self._buf, i * self._codec.width)
+
+    def set(self, i, val):
+        if val is None:
+            self._present[i] = 0
+        else:
+            self._codec.pack_into(self._buf, i * self._codec.width,
+                                  self._codec.encode(val))
+            self._present[i] = 1
+
+    def encoded_values(self):
+        """
+        Return the values in this store as a list in their encoded
+        (packed) representation, without converting them to native values.
+
+        """
+        record = self._codec.record
+        width = self._codec.width
+        multi = self._codec.multi
+        out = []
+        for i in range(self._len):
+            if self._present[i]:
+                val = record.unpack_from(self._buf, i * width)
+                out.append(val if multi else val[0])
+            else:
+                out.append(None)
+        return out
+
+    def extend(self, vals):
+        # encode everything first, so a failure leaves the store unchanged
+        self.extend_encoded([None if v is None else self._codec.encode(v) 
+                             for v in vals])
+
+    def extend_encoded(self, encoded):
+        """Append values already in their encoded representation"""
+        start = self._len
+        self._reserve(start + len(encoded))
+        width = self._codec.width
+        for i, ev in enumerate(encoded, start):
+            if ev is None:
+                self._present[i] = 0
+            else:
+                self._codec.pack_into(self._buf, i * width, ev)
+                self._present[i] = 1
+        self._len = start + len(encoded)
+
+    def pad(self, count):
+        self._reserve(self._len + count)
+        self._present[self._len:self._len + count] = bytes(count)
+        self._len += count
+
+    def delete(self, i):
+        width = self._codec.width
+        del(self._buf[i * width:(i + 1) * width])
+        del(self._present[i])
+        self._len -= 1
+
+    def clear(self):
+        self._buf = bytearray()
+        self._present = bytearray()
+        self._len = 0
+
+    def nbytes(self):
+        return sys.getsizeof(self._buf) + sys.getsizeof(self._present)
+
+def _column_store_for(prim):
+    if prim.name in _column_codec:
+        return _TypedColumnStore(_column_codec[prim.name])
+    else:
+        return _ListColumnStore()
+
+def test_result_column():
+    """Test typed and fallback result column storage"""
+    nc = ResultColumn(Element("test.natural", prim_natural))
+    nc[0] = 1
+    nc[3] = "42"
+    nc.extend([5, None, "7"])
+    assert len(nc) == 7
+    assert list(nc) == [1, None, None, 42, 5, None, 7]
+    assert nc[-1] == 7
+    assert nc[3:5] == [42, 5]
+    del(nc[0])
+    assert list(nc) == [None, None, 42, 5, None, 7]
+    nc[0] = 2**70
+    assert nc[0] == 2**70 and nc[2] == 42
+
+    tc = ResultColumn(Element("test.time", prim_time))
+    tc.extend(["2013-07-30 23:19:42.123456", datetime(1969, 12, 31, 23, 59)])
+    assert tc[0] == datetime(2013, 7, 30, 23, 19, 42, 123456)
+    assert tc[1] == datetime(1969, 12, 31, 23, 59)
+    tc[2] = time_now
+    assert tc[2] is time_now and tc[0].microsecond == 123456
+
+    ac = ResultColumn(Element("test.address", prim_address))
+    ac[0] = "10.0.27.101"
+    ac[1] = ip_address("2001:db8:1:33::c0:ffee")
+    dc = deepcopy(ac)
+    ac.clear()
+    assert len(ac) == 0
+    assert list(dc) == [ip_address("10.0.27.101"), 
+                        ip_address("2001:db8:1:33::c0:ffee")]
+
+    rc = ResultColumn(Element("test.real", prim_real))
+    rc.extend(range(100))
+    assert len(rc) == 100 and rc[99] == 99.0
+
 #######################################################################
 # Statements
 #######################################################################
@@ -1536,8 +2326,10 @@ class Parameter(Element):
     values.
 
     """
+    __slots__ = ('_val', '_constraint')
+
     def __init__(self, parent_element, constraint=constraint_all, val=None):
-        super().__init__(parent_element._name, parent_element._prim)
+        self._share_element(parent_element)
         self._val = None
 
         if isinstance(constraint, str):
@@ -1603,8 +2395,10 @@ class Metavalue(Element):
     Metavalues are used in statement metadata sections.
 
     """
+    __slots__ = ('_val',)
+
     def __init__(self, parent_element, val):
-        super().__init__(parent_element._name, parent_element._prim)
+        self._share_element(parent_element)
         self.set_value(val)
 
     def __repr__(self):
@@ -1612,7 +2406,7 @@ class Metavalue(Element):
                " value "+repr(self._val)+" >"
 
     def set_value(self, val):
-        if instanceof(val, str):
+        if isinstance(val, str):
             val = self._prim.parse(val)
         self._val = val
 
@@ -1629,44 +2423,144 @@ class ResultColumn(Element):
     Results it has one or more values, such that all the ResultColumns
     in the Result have the same number of values.
 
+    Natural, real, time, and address columns are stored as packed 
+    records (int64, double, int64 epoch microseconds, and packed 
+    addresses respectively) rather than as lists of Python objects;
+    indexing and iteration still yield native values.
+
     """
+    __slots__ = ('_store',)
+
     def __init__(self, parent_element):
-        super().__init__(parent_element._name, parent_element._prim)
-        self._vals = []
+        self._share_element(parent_element)
+        self._store = _column_store_for(self._prim)
 
     def __repr__(self):
         return "<ResultColumn "+str(self)+" "+repr(self._prim)+\
                " with "+str(len(self))+" values>"
 
     def __len__(self):
-        return len(self._vals)
+        return len(self._store)
+
+    def _index(self, key):
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("result column index out of range")
+        return key
 
     def __getitem__(self, key):
-        return self._vals[key]
+        if isinstance(key, slice):
+            return [self._store.get(i) for i in range(*key.indices(len(self)))]
+        return self._store.get(self._index(key))
+
+    def _unpack_store(self):
+        self._store = _ListColumnStore(list(self._store))
+
+    def _copy(self):
+        """Return a copy of this column sharing everything but its values"""
+        col = copy(self)
+        col._store = self._store.copy()
+        return col
+
+    def _slice(self, start, end):
+        """Return a copy of this column holding values start to end only"""
+        (start, end, step) = slice(start, end).indices(len(self))
+        col = copy(self)
+        col._store = self._store.slice(start, max(start, end))
+        return col
+
+    def _take(self, indices):
+        """Return a copy of this column holding the values at the given indices"""
+        col = copy(self)
+        col._store = self._store.take(indices)
+        return col
 
     def __setitem__(self, key, val):
         # Automatically parse strings
         if isinstance(val, str):
             val = self._prim.parse(val)
 
-        # Automatically extend column to fit
-        while len(self) < key:
-            self._vals.append(None)
-
-        # Append or replace value
-        if len(self) == key:
-            self._vals.append(val)
+        # Automatically extend column to fit, then append or replace
+        if key >= len(self):
+            self._store.pad(key - len(self))
+            self.extend([val])
         else:
-            self._vals[key] = val
+            key = self._index(key)
+            try:
+                self._store.set(key, val)
+            except (TypeError, struct.error):
+                self._unpack_store()
+                self._store.set(key, val)
 
     def __delitem__(self, key):
-        del(self._vals[key])
+        if isinstance(key, slice):
+            for i in sorted(range(*key.indices(len(self))), reverse=True):
+                self._store.delete(i)
+        else:
+            self._store.delete(self._index(key))
 
     def __iter__(self):
-        return iter(self._vals)
+        return iter(self._store)
+
+    def extend(self, vals):
+        """
+        Append a sequence of values (native or strings) to this column.
+
+        """
+        vals = [self._prim.parse(v) if isinstance(v, str) else v for v in vals]
+        try:
+            self._store.extend(vals)
+        except (TypeError, struct.error):
+            self._unpack_store()
+            self._store.extend(vals)
 
     def clear(self):
-        self._vals.clear()
+        self._store.clear()
+
+    def nbytes(self):
+        """Return the approximate number of bytes used to store values in this column"""
+        return self._store.nbytes()
+
+_hash_stats = collections.Counter()
+_hash_stats_lock = threading.Lock()
+
+def hash_cache_stats():
+    """
+    Return a dictionary of hit and miss counts for the per-statement 
+    schema, parameter value, coalescing, and token hash caches, 
+    with hit rates.
+
+    """
+    with _hash_stats_lock:
+        d = dict(_hash_stats)
+    for kind in ("schema", "pv", "pvd", "mpcv"):
+        hits = d.get(kind + "_hits", 0)
+        total = hits + d.get(kind + "_misses", 0)
+        if total > 0:
+            d[kind + "_hit_rate"] = hits / total
+    return d
+
+def reset_hash_cache_stats():
+    """Reset the counters returned by hash_cache_stats()"""
+    with _hash_stats_lock:
+        _hash_stats.clear()
+
+_body_keys = (KEY_PARAMETERS, KEY_METADATA, KEY_RESULTS, KEY_RESULTVALUES)
+
+def _all_shared(shared, names):
+    """
+    Return a frozenset of all names, reusing an existing set of shared 
+    names if it already covers them (shared names are always a subset).
+
+    """
+    if shared is not None and len(shared) == len(names):
+        return shared
+    return frozenset(names)
+
+# serializes lazy decoding of statement bodies; see Statement._decode_pending()
+_decode_lock = threading.RLock()
+_DECODING = object()
 
 class Statement(object):
     """
@@ -1677,21 +2571,35 @@ class Statement(object):
     :class:`mplane.model.Capability`, :class:`mplane.model.Specification`, 
     and :class:`mplane.model.Result` classes instead.
 
+    Statements created from a dictionary decode their header (verb, 
+    label, token, temporal scope) immediately, but defer decoding 
+    parameters, metadata, result columns, and result values until
+    one of these is first accessed.
+
     """
-    
+    __slots__ = ('_version', '_param_dict', '_metadata_dict', '_column_dict', 
+                 '_verb', '_label', '_token', '_link', '_export', 
+                 '_schedule', '_when', '_hashes', '_pending',
+                 '_shared_params', '_shared_columns', '_cursor')
+
     def __init__(self, dictval=None, verb=VERB_MEASURE, label=None, token=None, when=None):
         super().__init__()
         # Make a blank statement
         self._version = MPLANE_VERSION
-        self._params = collections.OrderedDict()
-        self._metadata = collections.OrderedDict()
-        self._resultcolumns = collections.OrderedDict()
+        self._pending = None
+        self._param_dict = collections.OrderedDict()
+        self._metadata_dict = collections.OrderedDict()
+        self._column_dict = collections.OrderedDict()
         self._verb = None
         self._label = None
         self._token = None
         self._link = None
         self._export = None
         self._schedule = None
+        self._hashes = None
+        self._shared_params = None
+        self._shared_columns = None
+        self._cursor = None
 
         if dictval is not None:
             # Fill in from dictionary
@@ -1716,6 +2624,50 @@ class Statement(object):
     def _more_repr(self):
         return ""
 
+    @property
+    def _params(self):
+        if self._pending is not None:
+            self._decode_pending()
+        return self._param_dict
+
+    @_params.setter
+    def _params(self, params):
+        if self._pending is not None:
+            self._decode_pending()
+        self._param_dict = params
+
+    @property
+    def _metadata(self):
+        if self._pending is not None:
+            self._decode_pending()
+        return self._metadata_dict
+
+    @_metadata.setter
+    def _metadata(self, metadata):
+        if self._pending is not None:
+            self._decode_pending()
+        self._metadata_dict = metadata
+
+    @property
+    def _resultcolumns(self):
+        if self._pending is not None:
+            self._decode_pending()
+        return self._column_dict
+
+    @_resultcolumns.setter
+    def _resultcolumns(self, resultcolumns):
+        if self._pending is not None:
+            self._decode_pending()
+        self._column_dict = resultcolumns
+
+    def is_decoded(self):
+        """
+        Return True if the parameters, metadata, and result values 
+        of this statement have been decoded.
+
+        """
+        return self._pending is None
+
     def _label_repr(self):
         if self._label is None:
             return ""
@@ -1740,6 +2692,9 @@ class Statement(object):
         self._params[elem_name] = Parameter(element(elem_name), 
                                   constraint=constraint,
                                   val = val)
+        if self._shared_params and elem_name in self._shared_params:
+            self._shared_params = self._shared_params - {elem_name}
+        self._invalidate_hashes(schema=True)
 
     def has_parameter(self, elem_name):
         """Return True if the statement has a parameter with the given name"""
@@ -1775,12 +2730,14 @@ class Statement(object):
 
     def set_parameter_value(self, elem_name, value):
         """Programatically set a value for a parameter on this Statement."""
-        elem = self._params[elem_name]
+        elem = self._own_parameter(elem_name)
         elem.set_value(value)
+        self._invalidate_hashes()
 
     def add_metadata(self, elem_name, val):
         """Programatically add a metadata element to this statement."""
         self._metadata[elem_name] = Metavalue(element(elem_name), val)
+        self._invalidate_hashes()
 
     def has_metadata(self, elem_name):
         """Return True if the statement has a metadata element with the given name"""
@@ -1797,6 +2754,9 @@ class Statement(object):
     def add_result_column(self, elem_name):
         """Programatically add a result column to this Statement."""
         self._resultcolumns[elem_name] = ResultColumn(element(elem_name))
+        if self._shared_columns and elem_name in self._shared_columns:
+            self._shared_columns = self._shared_columns - {elem_name}
+        self._invalidate_hashes(schema=True)
 
     def has_result_column(self, elem_name):
         return elem_name in self._resultcolumns
@@ -1814,6 +2774,14 @@ class Statement(object):
         return functools.reduce(max, 
                    [len(col) for col in self._resultcolumns.values()], 0)
 
+    def result_nbytes(self):
+        """
+        Return the approximate number of bytes used to store 
+        result values in this Statement.
+
+        """
+        return sum(col.nbytes() for col in self._resultcolumns.values())
+
     def get_link(self):
         """
         Get the statement's link URL, which specifies where the next message 
@@ -1840,6 +2808,21 @@ class Statement(object):
         """Return the statement's label"""
         return self._label
 
+    def get_cursor(self):
+        """
+        Return the statement's cursor, a count of result rows: in a 
+        Result, the number of rows produced for the measurement so far;
+        in a Redemption, the number of rows the client already has, so
+        that only rows after these are returned. None if the statement 
+        has no cursor.
+
+        """
+        return self._cursor
+
+    def set_cursor(self, cursor):
+        """Set the statement's cursor"""
+        self._cursor = cursor
+
     def when(self):
         """Get the statement's temporal scope"""
         return self._when
@@ -1859,6 +2842,40 @@ class Statement(object):
             raise ValueError("Cannot set temporal scope "+str(when)+
                              " within "+str(self._when))
         self._when = when
+        self._invalidate_hashes()
+
+    def _invalidate_hashes(self, schema=False):
+        """
+        Drop cached hashes after a change to this statement. 
+        The schema hash only depends on parameter and result column 
+        names, so it is only dropped if schema is True.
+
+        """
+        if self._hashes is None:
+            return
+        if schema:
+            self._hashes.clear()
+        else:
+            self._hashes.pop("pv", None)
+            self._hashes.pop("pvd", None)
+            self._hashes.pop("mpcv", None)
+
+    def _cached_hash(self, kind, compute, lim):
+        if self._hashes is None:
+            self._hashes = {}
+        try:
+            hstr = self._hashes[kind]
+            stat = kind + "_hits"
+        except KeyError:
+            hstr = compute()
+            self._hashes[kind] = hstr
+            stat = kind + "_misses"
+        with _hash_stats_lock:
+            _hash_stats[stat] += 1
+        if lim is not None:
+            return hstr[:lim]
+        else:
+            return hstr
 
     def _schema_hash(self, lim=None):
         """
@@ -1866,13 +2883,12 @@ class Statement(object):
         and result columns (the schema) of this statement.
 
         """
+        return self._cached_hash("schema", self._compute_schema_hash, lim)
+
+    def _compute_schema_hash(self):
         sstr = "p " + " ".join(sorted(self._params.keys())) + \
                " r " + " ".join(sorted(self._resultcolumns.keys()))
-        hstr = hashlib.md5(sstr.encode('utf-8')).hexdigest()
-        if lim is not None:
-            return hstr[:lim]
-        else:
-            return hstr
+        return hashlib.md5(sstr.encode('utf-8')).hexdigest()
 
     def _pv_hash(self, lim=None):
         """
@@ -1881,17 +2897,41 @@ class Statement(object):
         of this statement. Used as a specification key.
 
         """
+        return self._cached_hash("pv", self._compute_pv_hash, lim)
+
+    def _compute_pv_hash(self):
         spk = sorted(self._params.keys())
         spv = [self._params[k].unparse(self._params[k].get_value()) for k in spk]
         tstr = self._verb + " w " + str(self._when) +\
                " pk " + " ".join(spk) + \
                " pv " + " ".join(spv) + \
                " r " + " ".join(sorted(self._resultcolumns.keys()))
-        hstr = hashlib.md5(tstr.encode('utf-8')).hexdigest()
-        if lim is not None:
-            return hstr[:lim]
+        return hashlib.md5(tstr.encode('utf-8')).hexdigest()
+
+    def _pvd_hash(self, lim=None):
+        """
+        Return a hex string identifying the set of parameters, 
+        parameter values, and result columns of this statement, and the
+        duration and period but not the start of its temporal scope 
+        (the whole temporal scope for queries). Statements with the same
+        pvd hash starting at about the same time ask for the same 
+        measurement; used to coalesce specifications.
+
+        """
+        return self._cached_hash("pvd", self._compute_pvd_hash, lim)
+
+    def _compute_pvd_hash(self):
+        spk = sorted(self._params.keys())
+        spv = [self._params[k].unparse(self._params[k].get_value()) for k in spk]
+        if self._verb == VERB_QUERY:
+            wstr = str(self._when)
         else:
-            return hstr
+            wstr = str(self._when.duration()) + " p " + str(self._when.period())
+        tstr = self._verb + " d " + wstr +\
+               " pk " + " ".join(spk) + \
+               " pv " + " ".join(spv) + \
+               " r " + " ".join(sorted(self._resultcolumns.keys()))
+        return hashlib.md5(tstr.encode('utf-8')).hexdigest()
 
     def _mpcv_hash(self, lim=None):
         """
@@ -1901,6 +2941,9 @@ class Statement(object):
         Used as a complete token for statements.
 
         """
+        return self._cached_hash("mpcv", self._compute_mpcv_hash, lim)
+
+    def _compute_mpcv_hash(self):
         spk = sorted(self._params.keys())
         spc = [str(self._params[k]._constraint) for k in spk]
         spv = [self._params[k].unparse(self._params[k].get_value()) for k in spk]
@@ -1911,11 +2954,7 @@ class Statement(object):
                " pc " + " ".join(spc) + " pv " + " ".join(spv) + \
                " mk " + " ".join(smk) + " mv " + " ".join(smv) + \
                " r " + " ".join(sorted(self._resultcolumns.keys()))
-        hstr = hashlib.md5(tstr.encode('utf-8')).hexdigest()
-        if lim is not None:
-            return hstr[:lim]
-        else:
-            return hstr
+        return hashlib.md5(tstr.encode('utf-8')).hexdigest()
 
     def get_token(self, lim=None):
         if self._token is None:
@@ -1928,18 +2967,24 @@ class Statement(object):
     def _default_token(self):
       return self._mpcv_hash()
 
-    def _result_rows(self):
-        rows = []
+    def _result_row_iterator(self):
+        """
+        Iterate over result rows as lists of strings, one row at a time.
+
+        """
+        cols = list(self._resultcolumns.values())
         for row_index in range(self.count_result_rows()):
             row = []
-            rows.append(row)
-            for col in self._resultcolumns.values():
+            for col in cols:
                 try:
                     valstr = col._prim.unparse(col[row_index])
                 except IndexError:
                     valstr = VALUE_NONE
                 row.append(valstr)
-        return rows
+            yield row
+
+    def _result_rows(self):
+        return list(self._result_row_iterator())
 
     def to_dict(self):
         """
@@ -1947,6 +2992,17 @@ class Statement(object):
         to JSON or YAML), which can be passed as the dictval
         argument of the appropriate statement constructor.
 
+        """
+        d = self._header_dict()
+        if self.count_result_columns() > 0 and self.count_result_rows() > 0:
+            d[KEY_RESULTVALUES] = self._result_rows()
+        return d
+
+    def _header_dict(self):
+        """
+        Convert everything but the result values of this Statement
+        to a dictionary; used by to_dict() and by the streaming encoder.
+
         """
         self.validate()
         d = collections.OrderedDict()
@@ -1971,6 +3027,9 @@ class Statement(object):
         if self._schedule is not None:
             d[KEY_SCHEDULE] = self._schedule.to_dict()
 
+        if self._cursor is not None:
+            d[KEY_CURSOR] = self._cursor
+
         if self.count_parameters() > 0:
             d[KEY_PARAMETERS] = {t[0] : t[1] for t in [v._as_tuple() 
                                         for v in self._params.values()]}
@@ -1981,8 +3040,6 @@ class Statement(object):
 
         if self.count_result_columns() > 0:
             d[KEY_RESULTS] = [k for k in self._resultcolumns.keys()]
-            if self.count_result_rows() > 0:
-                d[KEY_RESULTVALUES] = self._result_rows()
 
         return d
 
@@ -1998,10 +3055,11 @@ class Statement(object):
 
     def _from_dict(self, d):
         """
-        Fill in this Statement with values from a dictionary
+        Fill in this Statement's header with values from a dictionary
         produced with to_dict (i.e., as taken from JSON or YAML).
-        Ignores result values, as these are handled by :func:`Result._from_dict()`; 
-        ignores the schedule section, as this is handled in :func:`Specification._from_dict()`.
+        Parameters, metadata, result columns and result values are left 
+        in the dictionary until first accessed; see _body_from_dict(). 
+        Ignores the schedule section, as this is handled in :func:`Specification._from_dict()`.
 
         """
         self._verb = d[self.kind_str()]
@@ -2025,6 +3083,35 @@ class Statement(object):
         if KEY_WHEN in d:
             self._when = When(d[KEY_WHEN])
 
+        if KEY_CURSOR in d:
+            self._cursor = int(d[KEY_CURSOR])
+
+        if any(k in d for k in _body_keys):
+            self._pending = d
+
+        self._invalidate_hashes(schema=True)
+
+    def _decode_pending(self):
+        # The body is filled in through the properties, which return at
+        # once to the decoding thread while _pending is _DECODING; other 
+        # threads wait on the lock until the body is complete.
+        with _decode_lock:
+            d = self._pending
+            if d is None or d is _DECODING:
+                return
+            self._pending = _DECODING
+            try:
+                self._body_from_dict(d)
+            finally:
+                self._pending = None
+
+    def _body_from_dict(self, d):
+        """
+        Fill in parameters, metadata, and result columns from a 
+        dictionary produced with to_dict(). Ignores result values, 
+        as these are handled by :func:`Result._body_from_dict()`.
+
+        """
         if KEY_PARAMETERS in d:
             self._params_from_dict(d[KEY_PARAMETERS])
 
@@ -2036,9 +3123,51 @@ class Statement(object):
             for v in d[KEY_RESULTS]:
                 self.add_result_column(v)
 
+        self._invalidate_hashes(schema=True)
+
     def _clear_constraints(self):
-        for param in self._params.values():
-            param._clear_constraint()
+        for (name, param) in list(self._params.items()):
+            if param._constraint is not constraint_all:
+                self._own_parameter(name)._clear_constraint()
+        self._invalidate_hashes()
+
+    def _share_from(self, statement):
+        """
+        Take the parameters, metadata, and result columns of a parent 
+        statement without copying them. Parameters and result columns 
+        are shared with the parent until either side changes them; 
+        see _own_parameter() and _own_result_column().
+
+        """
+        self._params = collections.OrderedDict(statement._params)
+        self._metadata = collections.OrderedDict(statement._metadata)
+        self._resultcolumns = collections.OrderedDict(statement._resultcolumns)
+        statement._shared_params = self._shared_params = \
+                _all_shared(statement._shared_params, self._params)
+        statement._shared_columns = self._shared_columns = \
+                _all_shared(statement._shared_columns, self._resultcolumns)
+
+    def _own_parameter(self, elem_name):
+        """
+        Return a named parameter for modification, 
+        copying it first if it is shared with another statement.
+
+        """
+        if self._shared_params and elem_name in self._shared_params:
+            self._params[elem_name] = copy(self._params[elem_name])
+            self._shared_params = self._shared_params - {elem_name}
+        return self._params[elem_name]
+
+    def _own_result_column(self, elem_name):
+        """
+        Return a named result column for modification, 
+        copying it first if it is shared with another statement.
+
+        """
+        if self._shared_columns and elem_name in self._shared_columns:
+            self._resultcolumns[elem_name] = self._resultcolumns[elem_name]._copy()
+            self._shared_columns = self._shared_columns - {elem_name}
+        return self._resultcolumns[elem_name]
 
 class Capability(Statement):
     """
@@ -2056,6 +3185,8 @@ class Capability(Statement):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, dictval=None, verb=VERB_MEASURE, label=None, token=None, when=None):
         super().__init__(dictval=dictval, verb=verb, label=label, token=token, when=when)
 
@@ -2107,6 +3238,8 @@ class Specification(Statement):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, dictval=None, capability=None, verb=VERB_MEASURE, label=None, token=None, when=None, schedule=None):
         super().__init__(dictval=dictval, verb=verb, label=label, token=token, when=when)
 
@@ -2118,14 +3251,14 @@ class Specification(Statement):
                 # Build a statement from a capabilitiy
                 self._verb = capability._verb
                 self._label = capability._label
-                self._metadata = capability._metadata
-                self._params = deepcopy(capability._params)
-                self._resultcolumns = deepcopy(capability._resultcolumns)
+                self._share_from(capability)
 
                 # inherit from capability only when necessary
                 if when is None:
                     self._when = capability._when
 
+                self._invalidate_hashes(schema=True)
+
     def _more_repr(self):
         return " p(v)/m/r "+str(self.count_parameters())+"("+\
                str(self.count_parameter_values())+")/"+\
@@ -2165,28 +3298,42 @@ class Specification(Statement):
 
     def set_single_values(self):
         """Fill in values for all parameters whose constraints allow only one value."""
-        for param in self._params.values():
-            param.set_single_value()
+        for (name, param) in list(self._params.items()):
+            if not param.has_value() and \
+               param._constraint.single_value() is not None:
+                self._own_parameter(name).set_single_value()
+        self._invalidate_hashes()
 
     def has_schedule(self):
         return self._schedule is not None
 
+    def schedule(self):
+        """Get the specification's schedule for repeated measurements"""
+        return self._schedule
+
     def _from_dict(self, d):
         super()._from_dict(d)
 
         if KEY_SCHEDULE in d:
-            self._schedule = Schedule._from_dict(d[KEY_SCHEDULE])
+            self._schedule = Schedule(dictval=d[KEY_SCHEDULE])
 
 class Result(Statement):
-    """docstring for Result: note the token is generally inherited from the specification"""
+    """
+    docstring for Result: note the token is generally inherited from the specification
+
+    A partial Result holds the rows produced so far by a measurement 
+    which is still running; see is_partial().
+
+    """
+    __slots__ = ('_partial',)
+
     def __init__(self, dictval=None, specification=None, verb=VERB_MEASURE, label=None, token=None, when=None):
+        self._partial = False
         super().__init__(dictval=dictval, verb=verb, label=label, token=token, when=when)
         if dictval is None and specification is not None:
             self._verb = specification._verb
             self._label = specification._label
-            self._metadata = specification._metadata
-            self._params = deepcopy(specification._params)
-            self._resultcolumns = deepcopy(specification._resultcolumns)
+            self._share_from(specification)
             # assign token from specification
             self._token = specification.get_token()
             # allow parameters to take values other than constrained
@@ -2195,6 +3342,8 @@ class Result(Statement):
             if when is not None:
                 self._when = specification._when
 
+            self._invalidate_hashes(schema=True)
+
 
     def _more_repr(self):
         return " p/m/r(r) "+str(self.count_parameters())+"/"+\
@@ -2205,6 +3354,51 @@ class Result(Statement):
     def kind_str(self):
         return KIND_RESULT
 
+    def is_partial(self):
+        """
+        Return True if this Result holds only the rows produced so far 
+        by a measurement which is still running.
+
+        """
+        return self._partial
+
+    def set_partial(self, partial=True):
+        """Mark this Result as partial (or complete)"""
+        self._partial = partial
+
+    def _header_dict(self):
+        d = super()._header_dict()
+        if self._partial:
+            d[KEY_PARTIAL] = True
+        return d
+
+    def _from_dict(self, d):
+        super()._from_dict(d)
+        self._partial = bool(d.get(KEY_PARTIAL, False))
+
+    def row_slice(self, start=0, end=None):
+        """
+        Return a new Result with this Result's parameters, metadata, 
+        temporal scope, token, and cursor, holding a copy of rows start 
+        to end (exclusive) only. Result columns are not shared, so this
+        Result can continue to be appended to without copying.
+
+        """
+        res = Result(verb=self._verb, label=self._label, 
+                     token=self.get_token(), when=self._when)
+        res._link = self._link
+        res._export = self._export
+        res._cursor = self._cursor
+        res._partial = self._partial
+        res._params = collections.OrderedDict(self._params)
+        self._shared_params = res._shared_params = \
+                _all_shared(self._shared_params, res._params)
+        res._metadata = collections.OrderedDict(self._metadata)
+        res._resultcolumns = collections.OrderedDict(
+                (k, col._slice(start, end)) for (k, col) in self._resultcolumns.items())
+        res._invalidate_hashes(schema=True)
+        return res
+
     def validate(self):
         pval = functools.reduce(operator.__and__, 
                         (p.has_value() for p in self._params.values()),
@@ -2216,23 +3410,100 @@ class Result(Statement):
         if (not self._when.is_definite()):
             raise ValueError("Results must have definite temporal scope.")
 
-    def _from_dict(self, d):
+    def _body_from_dict(self, d):
         """
-        Fill in this Result with values from a dictionary
-        produced with to_dict().
+        Fill in this Result's parameters, metadata, result columns
+        and result values from a dictionary produced with to_dict().
 
         """
-        super()._from_dict(d)
-
-        column_key = list(self._resultcolumns.keys())
+        super()._body_from_dict(d)
 
         if KEY_RESULTVALUES in d:
-            for i, row in enumerate(d[KEY_RESULTVALUES]):
+            self._append_rows(d[KEY_RESULTVALUES])
+
+    def _append_rows(self, rows):
+        """
+        Append a sequence of rows (lists of values or strings, in result 
+        column order) to this Result. Rows are transposed and appended 
+        column by column where possible.
+
+        """
+        cols = [self._own_result_column(k) for k in self._resultcolumns.keys()]
+        base = self.count_result_rows()
+        rows = list(rows)
+
+        if all(len(col) == base for col in cols) and \
+           all(len(row) == len(cols) for row in rows):
+            for j, col in enumerate(cols):
+                col.extend([row[j] for row in rows])
+        else:
+            for i, row in enumerate(rows, base):
                 for j, val in enumerate(row):
-                    self._resultcolumns[column_key[j]][i] = val
+                    cols[j][i] = val
 
     def set_result_value(self, elem_name, val, row_index=0):
-        self._resultcolumns[elem_name][row_index] = val
+        self._own_result_column(elem_name)[row_index] = val
+
+    def select(self, columns=None, filters=None):
+        """
+        Return a new Result with this Result's parameters, metadata, 
+        temporal scope, token, and cursor, holding only the named result
+        columns (all columns if None), and only the rows for which every
+        filter holds. Filters are (column name, operator, value) tuples;
+        operators are ==, !=, <, <=, >, and >=, and values are parsed 
+        according to the column's primitive. Rows with a None 
+        value in a filtered column are never selected. Without filters, 
+        the returned Result shares its result columns with this one.
+
+        Raises ValueError for unknown columns or operators, and for 
+        malformed filters or values.
+
+        """
+        if columns is None:
+            columns = list(self._resultcolumns.keys())
+        filters = [_check_filter(f) for f in filters or ()]
+        for name in itertools.chain(columns, (f[0] for f in filters)):
+            if not isinstance(name, str) or name not in self._resultcolumns:
+                raise ValueError("No result column "+repr(name))
+
+        res = self.row_slice(0, 0)
+        if not filters:
+            res._resultcolumns = collections.OrderedDict(
+                    (k, self._resultcolumns[k]) for k in columns)
+            self._shared_columns = res._shared_columns = \
+                    _all_shared(self._shared_columns, self._resultcolumns)
+            return res
+
+        # evaluate filters column by column, narrowing the selected rows
+        rows = range(self.count_result_rows())
+        for (name, op, val) in filters:
+            opfn = _filter_ops[op]
+            col = self._resultcolumns[name]
+            try:
+                val = col._prim.parse(val if isinstance(val, str) else str(val))
+            except (ValueError, TypeError):
+                val = None
+            if val is None:
+                raise ValueError("Invalid value for filter on "+name)
+            vals = list(col)
+            try:
+                rows = [i for i in rows if vals[i] is not None and opfn(vals[i], val)]
+            except TypeError:
+                raise ValueError("Cannot compare "+name+" with "+repr(val))
+
+        res._resultcolumns = collections.OrderedDict(
+                (k, self._resultcolumns[k]._take(rows)) for k in columns)
+        return res
+
+    def append_result(self, result):
+        """
+        Append the rows of another Result with the same result columns
+        to this one, column by column; used to reassemble a Result 
+        redeemed incrementally with a cursor.
+
+        """
+        for (name, col) in result._resultcolumns.items():
+            self._own_result_column(name).extend(col)
 
     def schema_dict_iterator(self):
         """
@@ -2247,6 +3518,90 @@ class Result(Statement):
             yield d
 
 
+def test_hash_cache():
+    """Test statement hash caching and invalidation"""
+    initialize_registry()
+    cap = Capability(when="now ... future / 1s")
+    cap.add_parameter("source.ip4", "10.0.27.2")
+    cap.add_parameter("destination.ip4")
+    cap.add_result_column("delay.twoway.icmp.us")
+    spec = Specification(capability=cap)
+    spec.set_single_values()
+
+    reset_hash_cache_stats()
+    sh = spec._schema_hash()
+    assert spec._schema_hash() == sh == cap._schema_hash()
+    assert hash_cache_stats()["schema_hits"] == 1
+
+    pv = spec._pv_hash()
+    spec.set_parameter_value("destination.ip4", "10.0.37.2")
+    assert spec._pv_hash() != pv
+    assert spec._pv_hash() == spec._compute_pv_hash()
+    assert spec._schema_hash() == sh
+    pvd = spec._pvd_hash()
+    spec.set_when("now + 1m / 1s")
+    assert spec._pv_hash() == spec._compute_pv_hash()
+    assert spec._pvd_hash() != pvd
+    pvd = spec._pvd_hash()
+    spec.set_when(When(a=datetime.utcnow() + timedelta(seconds=1),
+                       d=timedelta(minutes=1), p=timedelta(seconds=1)))
+    assert spec._pvd_hash() == pvd
+    spec.add_result_column("delay.twoway.icmp.us.min")
+    assert spec._schema_hash() != sh
+
+    stats = hash_cache_stats()
+    assert stats["schema_misses"] == 3 and stats["pv_misses"] == 3
+    assert 0 < stats["schema_hit_rate"] < 1
+
+    # lookups from many threads are all counted
+    reset_hash_cache_stats()
+    def lookup():
+        for i in range(10000):
+            spec._schema_hash()
+    threads = [threading.Thread(target=lookup) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert hash_cache_stats()["schema_hits"] == 40000
+
+def test_copy_on_write():
+    """Test parameter and result column sharing between statements"""
+    initialize_registry()
+    cap = Capability(when="now ... future / 1s")
+    cap.add_parameter("source.ip4", "10.0.27.2")
+    cap.add_parameter("destination.ip4")
+    cap.add_result_column("delay.twoway.icmp.us")
+
+    spec = Specification(capability=cap)
+    assert spec._params["destination.ip4"] is cap._params["destination.ip4"]
+    spec.set_single_values()
+    spec.set_parameter_value("destination.ip4", "10.0.37.2")
+    assert spec._params["destination.ip4"] is not cap._params["destination.ip4"]
+    assert cap.get_parameter_value("destination.ip4") is None
+    assert cap.get_parameter_value("source.ip4") is None
+
+    rcpt = Receipt(specification=spec)
+    assert rcpt._params["destination.ip4"] is spec._params["destination.ip4"]
+    spec.set_parameter_value("destination.ip4", "10.0.37.3")
+    assert str(rcpt.get_parameter_value("destination.ip4")) == "10.0.37.2"
+
+    res = Result(specification=spec)
+    assert res.get_token() == spec.get_token()
+    res.set_result_value("delay.twoway.icmp.us", 1000)
+    assert spec.count_result_rows() == 0
+    assert str(spec._params["source.ip4"]._constraint) == "10.0.27.2"
+    assert str(res._params["source.ip4"]._constraint) == "*"
+
+    res._append_rows([[2000], [3000]])
+    col = res._resultcolumns["delay.twoway.icmp.us"]
+    part = res.row_slice(1)
+    assert part.count_result_rows() == 2
+    assert part._resultcolumns["delay.twoway.icmp.us"][0] == 2000
+    res.set_result_value("delay.twoway.icmp.us", 4000, 3)
+    assert res._resultcolumns["delay.twoway.icmp.us"] is col
+    assert part.count_result_rows() == 2
+
 #######################################################################
 # Notifications
 #######################################################################
@@ -2311,15 +3666,16 @@ class StatementNotification(Statement):
     directly
 
     """
+    __slots__ = ()
+
     def __init__(self, dictval=None, statement=None, verb=VERB_MEASURE, token=None):
         super().__init__(dictval=dictval, verb=verb, token=token)
         if dictval is None and statement is not None:
             self._verb = statement._verb
             self._when = statement._when
-            self._metadata = statement._metadata
-            self._params = deepcopy(statement._params)
-            self._resultcolumns = deepcopy(statement._resultcolumns)
+            self._share_from(statement)
             self._token = statement.get_token()
+            self._invalidate_hashes(schema=True)
 
     def __repr__(self):
         return "<"+self.kind_str()+": "+self._label_repr()+self.get_token()+">"
@@ -2344,6 +3700,8 @@ class Receipt(StatementNotification):
     A component presents a receipt to a Client in lieu of a result, when the
     result will not be available in a reasonable amount of time; or to confirm
     a Specification """
+    __slots__ = ()
+
     def __init__(self, dictval=None, specification=None, token=None):
         super().__init__(dictval=dictval, statement=specification, token=token)
 
@@ -2358,20 +3716,96 @@ class Redemption(StatementNotification):
     A client presents a Redemption to a component from which it has received
     a Receipt in order to get the associated Result.
 
+    A Redemption may ask the component for only some of the Result: the 
+    rows after a cursor (see Statement.get_cursor()), a projection onto 
+    a subset of result columns, and only the rows passing a set of 
+    filters (see Result.select()).
+
     """
-    def __init__(self, dictval=None, receipt=None, token=None):
+    __slots__ = ('_projection', '_filters')
+
+    def __init__(self, dictval=None, receipt=None, token=None, cursor=None,
+                 projection=None, filters=None):
+        self._projection = None
+        self._filters = []
         super().__init__(dictval=dictval, statement=receipt, token=token)
         if receipt is not None and token is None:
             self._token = receipt.get_token()
+        if cursor is not None:
+            self._cursor = cursor
+        if projection is not None:
+            self.set_projection(projection)
+        if filters is not None:
+            for (name, op, val) in filters:
+                self.add_filter(name, op, val)
 
     def kind_str(self):
         return KIND_REDEMPTION
 
+    def projection(self):
+        """
+        Return the list of result column names to redeem, 
+        or None for all columns.
+
+        """
+        return self._projection
+
+    def set_projection(self, names):
+        """Redeem only the given result columns"""
+        if isinstance(names, str) or \
+           not all(isinstance(name, str) for name in names):
+            raise ValueError("Projection must be a list of column names")
+        self._projection = list(names)
+
+    def filters(self):
+        """Return the list of (column name, operator, value) row filters"""
+        return self._filters
+
+    def add_filter(self, name, op, val):
+        """
+        Redeem only rows for which the named result column compares 
+        with the given value using the given operator 
+        (==, !=, <, <=, >, or >=).
+
+        """
+        self._filters.append(_check_filter((name, op, val)))
+
+    def is_selective(self):
+        """Return True if this Redemption projects or filters the Result"""
+        return self._projection is not None or len(self._filters) > 0
+
+    def _header_dict(self):
+        d = super()._header_dict()
+        if self._projection is not None:
+            d[KEY_PROJECTION] = list(self._projection)
+        if len(self._filters):
+            d[KEY_FILTER] = [[name, op, self._unparse_filter_value(name, val)] 
+                             for (name, op, val) in self._filters]
+        return d
+
+    def _unparse_filter_value(self, name, val):
+        if isinstance(val, str):
+            return val
+        if name in self._resultcolumns:
+            return self._resultcolumns[name]._prim.unparse(val)
+        return str(val)
+
+    def _from_dict(self, d):
+        super()._from_dict(d)
+        if KEY_PROJECTION in d:
+            self.set_projection(d[KEY_PROJECTION])
+        if KEY_FILTER in d:
+            if not isinstance(d[KEY_FILTER], list):
+                raise ValueError("Filters must be a list")
+            self._filters = [_check_filter(f) for f in d[KEY_FILTER]]
+
     def validate(self):
         Specification.validate(self)
 
 class Withdrawal(StatementNotification):
     """A Withdrawal cancels a Capability"""
+    __slots__ = ()
+
     def __init__(self, dictval=None, capability=None, token=None):
         super().__init__(dictval=dictval, statement=capability, token=token)
 
@@ -2383,6 +3817,8 @@ class Withdrawal(StatementNotification):
 
 class Interrupt(StatementNotification):
     """An Interrupt cancels a Specification"""
+    __slots__ = ()
+
     def __init__(self, dictval=None, specification=None, token=None):
         super().__init__(dictval=dictval, statement=specification, token=token)
 
@@ -2400,10 +3836,17 @@ class Envelope(object):
     """
     Envelopes are used to contain other Messages.
 
+    Envelopes created from a dictionary keep their contents as 
+    dictionaries, decoding each message the first time it is iterated.
+
+    An envelope returned for a Redemption of a repeated measurement 
+    carries a cursor: the number of Results produced so far.
+
     """
     _version = MPLANE_VERSION
     _content_type = None
     _messages = None
+    _cursor = None
 
     def __init__(self, dictval=None, content_type=ENVELOPE_MESSAGE):
         super().__init__()
@@ -2416,13 +3859,37 @@ class Envelope(object):
     def __repr__(self):
         return "<Envelope "+self._content_type+\
                 " ("+str(len(self._messages))+"): "+\
-                " ".join(map(repr, self._messages))+">"
+                " ".join(map(repr, self.messages()))+">"
 
     def append_message(self, msg):
         self._messages.append(msg)
 
     def messages(self):
-        return iter(self._messages)
+        """
+        Iterate over the messages in this envelope, 
+        decoding any not yet decoded.
+
+        """
+        i = 0
+        while i < len(self._messages):
+            msg = self._messages[i]
+            if isinstance(msg, dict):
+                msg = message_from_dict(msg)
+                self._messages[i] = msg
+            yield msg
+            i += 1
+
+    def count_messages(self):
+        """Return the number of messages in this envelope"""
+        return len(self._messages)
+
+    def get_cursor(self):
+        """Return the envelope's cursor, or None if it has none"""
+        return self._cursor
+
+    def set_cursor(self, cursor):
+        """Set the envelope's cursor"""
+        self._cursor = cursor
 
     def kind_str(self):
         return KIND_ENVELOPE
@@ -2431,7 +3898,11 @@ class Envelope(object):
         d = {}
         d[self.kind_str()] = self._content_type
         d[KEY_VERSION] = self._version
-        d[KEY_CONTENTS] = [m.to_dict() for m in self.messages()]
+        if self._cursor is not None:
+            d[KEY_CURSOR] = self._cursor
+        # contents not yet decoded are passed through unchanged
+        d[KEY_CONTENTS] = [m if isinstance(m, dict) else m.to_dict() 
+                           for m in self._messages]
         return d
 
     def _from_dict(self, d):
@@ -2441,8 +3912,10 @@ class Envelope(object):
             if int(d[KEY_VERSION]) > MPLANE_VERSION:
                 raise ValueError("Version mismatch")
 
-        for md in self[KEY_CONTENTS]:
-          self.append_message(message_from_dict(md))
+        if KEY_CURSOR in d:
+            self._cursor = int(d[KEY_CURSOR])
+
+        self._messages = list(d[KEY_CONTENTS])
 
 #######################################################################
 # Utility methods
@@ -2472,9 +3945,231 @@ def message_from_dict(d):
 def parse_json(jstr):
     return message_from_dict(json.loads(jstr))
 
+JSON_INDENT = 2
+JSON_CHUNK_ROWS = 1000
+
+def _dump_json(d):
+    return json.dumps(d, sort_keys=True, indent=JSON_INDENT, 
+                      separators=(',',': '))
+
 def unparse_json(msg):
-    return json.dumps(msg.to_dict(), 
-                      sort_keys=True, indent=2, separators=(',',': '))
+    return _dump_json(msg.to_dict())
+
+def unparse_json_stream(msg, chunk_rows=JSON_CHUNK_ROWS):
+    """
+    Generate the JSON representation of a message as a sequence of 
+    strings: first everything but the result values, then the result 
+    values in chunks of at most chunk_rows rows. Rows are only unparsed 
+    as each chunk is generated.
+
+    The result values are placed after all other keys, so that a
+    streaming parser (see :class:`MessageStream`) sees the complete
+    header before the first row; otherwise the output is formatted 
+    as by unparse_json().
+
+    """
+    if not isinstance(msg, Statement) or msg.count_result_rows() == 0:
+        yield unparse_json(msg)
+        return
+
+    # result values are nested two levels deep in the message object
+    key_indent = "\n" + " " * JSON_INDENT
+    row_indent = "\n" + " " * (2 * JSON_INDENT)
+    val_indent = "\n" + " " * (3 * JSON_INDENT)
+
+    # strip the closing brace from the header
+    head = _dump_json(msg._header_dict())[:-2]
+    yield head + "," + key_indent + json.dumps(KEY_RESULTVALUES) + ": ["
+
+    rows = []
+    sep = ""
+    for row in msg._result_row_iterator():
+        rows.append(sep + row_indent + "[" + val_indent +
+                    ("," + val_indent).join(map(json.dumps, row)) +
+                    row_indent + "]")
+        sep = ","
+        if len(rows) >= chunk_rows:
+            yield "".join(rows)
+            rows.clear()
+    rows.append(key_indent + "]\n}")
+    yield "".join(rows)
+
+class MessageStream(object):
+    """
+    Incrementally parses a JSON mPlane message from an iterable of 
+    chunks (bytes or strings), e.g. from urllib3's HTTPResponse.stream().
+
+    The message header (everything up to the result values) is parsed 
+    on construction and available via message(); result rows are then
+    parsed lazily as they are iterated via rows() or row_batches(), 
+    so a large Result can be processed in constant memory. 
+    
+    unparse_json_stream() places the result values last. For messages
+    with keys following the result values (e.g. from unparse_json()), 
+    the message is rebuilt with those keys once all rows have been read.
+
+    Call read_rows() to instead accumulate all rows into the message.
+
+    """
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._in_rows = False
+        self._header = collections.OrderedDict()
+
+        self._parse_header()
+        self._msg = message_from_dict(self._header)
+
+    def message(self):
+        """
+        Return the message decoded from the header. For Results, the 
+        result columns are empty unless read_rows() has been called.
+
+        """
+        return self._msg
+
+    def _fill(self):
+        if self._eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._eof = True
+            chunk = b""
+        if isinstance(chunk, bytes):
+            chunk = self._utf8.decode(chunk, final=self._eof)
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or None at EOF."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c is None or c not in chars:
+            raise ValueError("Malformed mPlane JSON message: expected "+
+                             repr(chars)+", got "+repr(c))
+        self._pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                (val, end) = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return val
+
+    def _parse_header(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == KEY_RESULTVALUES:
+                self._expect("[")
+                self._in_rows = True
+                return
+            self._header[key] = self._value()
+            if self._expect(",}") == "}":
+                return
+
+    def _raw_rows(self):
+        if not self._in_rows:
+            return
+        if self._peek() == "]":
+            self._pos += 1
+        else:
+            while True:
+                yield self._value()
+                if self._expect(",]") == "]":
+                    break
+        self._in_rows = False
+        self._parse_trailer()
+
+    def _parse_trailer(self):
+        trailer = collections.OrderedDict()
+        while self._expect(",}") == ",":
+            key = self._value()
+            self._expect(":")
+            trailer[key] = self._value()
+
+        # rebuild the message if the header was incomplete, keeping any rows
+        if len(trailer):
+            self._header.update(trailer)
+            msg = message_from_dict(self._header)
+            if isinstance(msg, Result):
+                msg._resultcolumns = self._msg._resultcolumns
+            self._msg = msg
+
+    def rows(self):
+        """
+        Iterate over result rows as lists of values, parsed according 
+        to the primitives of the result columns.
+
+        """
+        if isinstance(self._msg, Result):
+            prims = [col._prim for col in self._msg._resultcolumns.values()]
+        else:
+            prims = []
+        for row in self._raw_rows():
+            yield [prim.parse(val) for (prim, val) in zip(prims, row)]
+
+    def row_batches(self, size=JSON_CHUNK_ROWS):
+        """Iterate over lists of at most size rows"""
+        batch = []
+        for row in self.rows():
+            batch.append(row)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if len(batch):
+            yield batch
+
+    def read_rows(self, size=JSON_CHUNK_ROWS):
+        """
+        Read all remaining rows into the message, and return it.
+
+        """
+        batch = []
+        for row in self._raw_rows():
+            batch.append(row)
+            if len(batch) >= size:
+                self._msg._append_rows(batch)
+                batch.clear()
+        if len(batch):
+            self._msg._append_rows(batch)
+        return self._msg
+
+def parse_json_stream(chunks):
+    """
+    Begin parsing a message from an iterable of JSON chunks; 
+    returns a :class:`MessageStream`.
+
+    """
+    return MessageStream(chunks)
 
 def parse_yaml(ystr):
     return mplane.model.message_from_dict(yaml.load(ystr))
@@ -2482,3 +4177,426 @@ def parse_yaml(ystr):
 def unparse_yaml(msg):
     return yaml.dump(dict(msg.to_dict()), default_flow_style=False, indent=4)
 
+
+#######################################################################
+# Binary encoding
+#######################################################################
+
+MIME_JSON = "application/x-mplane+json"
+MIME_BINARY = "application/x-mplane+binary"
+
+BINARY_MAGIC = b"mPb0"
+
+_BCOL_STRING = 0
+_BCOL_NATURAL = 1
+_BCOL_REAL = 2
+_BCOL_TIME = 3
+_BCOL_ADDRESS = 4
+_BCOL_BOOLEAN = 5
+
+_binary_column_tag = { prim_natural.name: _BCOL_NATURAL,
+                       prim_real.name:    _BCOL_REAL,
+                       prim_time.name:    _BCOL_TIME,
+                       prim_address.name: _BCOL_ADDRESS,
+                       prim_boolean.name: _BCOL_BOOLEAN }
+
+def _put_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _need_bytes(buf, end):
+    # refuse to read past the end of a binary message
+    if end > len(buf):
+        raise ValueError("truncated mPlane binary message")
+
+def _get_varint(buf, pos):
+    n = 0
+    shift = 0
+    while True:
+        _need_bytes(buf, pos + 1)
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return (n, pos)
+        shift += 7
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def _unzigzag(n):
+    return -((n + 1) >> 1) if n & 1 else n >> 1
+
+def _column_encoded_values(col, tag):
+    """
+    Return a list of the values in a column in the representation used 
+    by the given binary column tag, or raise TypeError if a value
+    cannot be so represented.
+
+    """
+    if isinstance(col._store, _TypedColumnStore):
+        return col._store.encoded_values()
+    elif tag == _BCOL_BOOLEAN:
+        vals = list(col)
+        for v in vals:
+            if v is not None and not isinstance(v, bool):
+                raise TypeError("not a boolean")
+        return vals
+    else:
+        codec = _column_codec[col._prim.name]
+        return [None if v is None else codec.encode(v) for v in col]
+
+def _put_binary_column(out, col, nrows):
+    tag = _binary_column_tag.get(col._prim.name, _BCOL_STRING)
+    vals = None
+    if tag != _BCOL_STRING:
+        try:
+            vals = _column_encoded_values(col, tag)
+        except (TypeError, struct.error):
+            tag = _BCOL_STRING
+    if tag == _BCOL_STRING:
+        vals = [None if v is None else col._prim.unparse(v) for v in col]
+    vals.extend([None] * (nrows - len(vals)))
+
+    # tag, then presence bitmap, then present values
+    out.append(tag)
+    bitmap = bytearray((nrows + 7) // 8)
+    for i, v in enumerate(vals):
+        if v is not None:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    out += bitmap
+    present = [v for v in vals if v is not None]
+
+    if tag == _BCOL_NATURAL:
+        for v in present:
+            _put_varint(out, _zigzag(v))
+    elif tag == _BCOL_TIME:
+        # delta-encode timestamps, which are generally increasing
+        last = 0
+        for v in present:
+            _put_varint(out, _zigzag(v - last))
+            last = v
+    elif tag == _BCOL_REAL:
+        out += struct.pack("<%ud" % len(present), *present)
+    elif tag == _BCOL_ADDRESS:
+        for (version, packed) in present:
+            out.append(version)
+            out += packed[:4] if version == 4 else packed[:16]
+    elif tag == _BCOL_BOOLEAN:
+        out += bytes(1 if v else 0 for v in present)
+    else:
+        for v in present:
+            vb = v.encode("utf-8")
+            _put_varint(out, len(vb))
+            out += vb
+
+def _get_binary_column(buf, pos, col, nrows):
+    nbitmap = (nrows + 7) // 8
+    _need_bytes(buf, pos + 1 + nbitmap)
+    tag = buf[pos]
+    pos += 1
+    bitmap = buf[pos:pos + nbitmap]
+    pos += nbitmap
+    present = [bool(bitmap[i >> 3] & (1 << (i & 7))) for i in range(nrows)]
+    count = sum(present)
+
+    vals = []
+    if tag == _BCOL_NATURAL:
+        for i in range(count):
+            (v, pos) = _get_varint(buf, pos)
+            vals.append(_unzigzag(v))
+    elif tag == _BCOL_TIME:
+        last = 0
+        for i in range(count):
+            (v, pos) = _get_varint(buf, pos)
+            last += _unzigzag(v)
+            vals.append(last)
+    elif tag == _BCOL_REAL:
+        _need_bytes(buf, pos + 8 * count)
+        vals = list(struct.unpack_from("<%ud" % count, buf, pos))
+        pos += 8 * count
+    elif tag == _BCOL_ADDRESS:
+        for i in range(count):
+            _need_bytes(buf, pos + 1)
+            version = buf[pos]
+            width = 4 if version == 4 else 16
+            _need_bytes(buf, pos + 1 + width)
+            vals.append((version, bytes(buf[pos + 1:pos + 1 + width])))
+            pos += 1 + width
+    elif tag == _BCOL_BOOLEAN:
+        _need_bytes(buf, pos + count)
+        vals = [bool(b) for b in buf[pos:pos + count]]
+        pos += count
+    elif tag == _BCOL_STRING:
+        for i in range(count):
+            (n, pos) = _get_varint(buf, pos)
+            _need_bytes(buf, pos + n)
+            vals.append(bytes(buf[pos:pos + n]).decode("utf-8"))
+            pos += n
+    else:
+        raise ValueError("Unknown binary column type "+str(tag))
+
+    it = iter(vals)
+    vals = [next(it) if p else None for p in present]
+
+    # typed columns take encoded values directly
+    if tag in (_BCOL_NATURAL, _BCOL_REAL, _BCOL_TIME, _BCOL_ADDRESS):
+        if isinstance(col._store, _TypedColumnStore) and \
+           _binary_column_tag[col._prim.name] == tag and len(col) == 0:
+            try:
+                col._store.extend_encoded(vals)
+                return pos
+            except struct.error:
+                pass
+        codec = _column_codec[_column_prim_for_tag[tag]]
+        if codec.decode is not None:
+            vals = [None if v is None else codec.decode(v) for v in vals]
+    col.extend(vals)
+    return pos
+
+_column_prim_for_tag = { v: k for (k, v) in _binary_column_tag.items() }
+
+def _put_binary_message(out, msg):
+    if isinstance(msg, Statement):
+        d = msg._header_dict()
+    elif isinstance(msg, Envelope):
+        d = msg.to_dict()
+        del(d[KEY_CONTENTS])
+    else:
+        d = msg.to_dict()
+    hb = json.dumps(d, separators=(',',':')).encode("utf-8")
+    _put_varint(out, len(hb))
+    out += hb
+
+    if isinstance(msg, Statement):
+        nrows = msg.count_result_rows()
+        _put_varint(out, nrows)
+        if nrows > 0:
+            for col in msg._resultcolumns.values():
+                _put_binary_column(out, col, nrows)
+    elif isinstance(msg, Envelope):
+        msgs = list(msg.messages())
+        _put_varint(out, len(msgs))
+        for m in msgs:
+            _put_binary_message(out, m)
+    else:
+        _put_varint(out, 0)
+
+def _get_binary_message(buf, pos):
+    (n, pos) = _get_varint(buf, pos)
+    _need_bytes(buf, pos + n)
+    d = json.loads(bytes(buf[pos:pos + n]).decode("utf-8"))
+    pos += n
+    (count, pos) = _get_varint(buf, pos)
+
+    if KIND_ENVELOPE in d:
+        msg = Envelope(content_type=d[KIND_ENVELOPE])
+        msg.set_cursor(d.get(KEY_CURSOR))
+        for i in range(count):
+            (m, pos) = _get_binary_message(buf, pos)
+            msg.append_message(m)
+    else:
+        msg = message_from_dict(d)
+        if count > 0:
+            for name in list(msg._resultcolumns.keys()):
+                pos = _get_binary_column(buf, pos, 
+                                         msg._own_result_column(name), count)
+    return (msg, pos)
+
+def unparse_binary(msg):
+    """
+    Encode a message in the mPlane binary encoding (MIME_BINARY).
+    Everything but result values is carried as compact JSON; result 
+    values are carried column by column in typed form: naturals as 
+    zigzag varints, times as delta-encoded varint epoch microseconds, 
+    reals as doubles, and addresses as raw bytes.
+
+    """
+    out = bytearray(BINARY_MAGIC)
+    _put_binary_message(out, msg)
+    return bytes(out)
+
+def parse_binary(buf):
+    """Decode a message in the mPlane binary encoding"""
+    buf = memoryview(buf)
+    if bytes(buf[:len(BINARY_MAGIC)]) != BINARY_MAGIC:
+        raise ValueError("Not an mPlane binary message")
+    (msg, pos) = _get_binary_message(buf, len(BINARY_MAGIC))
+    return msg
+
+def test_json_stream():
+    """Test streamed JSON encoding and parsing"""
+    initialize_registry()
+    spec = Specification(verb=VERB_QUERY, when="2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    spec.add_parameter("destination.ip4", val="10.0.37.2")
+    spec.add_result_column("time")
+    spec.add_result_column("delay.twoway.icmp.us")
+    assert "".join(unparse_json_stream(spec)) == unparse_json(spec)
+
+    res = Result(specification=spec)
+    res.set_when("2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    for i in range(25):
+        res.set_result_value("time", parse_time("2014-12-24 22:18:42") + 
+                                     timedelta(seconds=i), i)
+        res.set_result_value("delay.twoway.icmp.us", 1000 + i, i)
+    chunks = list(unparse_json_stream(res, chunk_rows=10))
+    assert len(chunks) == 4
+    jstr = "".join(chunks)
+    assert json.loads(jstr) == json.loads(unparse_json(res))
+
+    # feed the parser in small, unaligned byte chunks
+    jbytes = jstr.encode("utf-8")
+    bchunks = [jbytes[i:i+7] for i in range(0, len(jbytes), 7)]
+    ms = parse_json_stream(bchunks)
+    assert ms.message().get_token() == res.get_token()
+    assert ms.message().count_result_rows() == 0
+    batches = list(ms.row_batches(10))
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert batches[2][4] == [parse_time("2014-12-24 22:19:06"), 1024]
+
+    ms = parse_json_stream(bchunks)
+    assert unparse_json(ms.read_rows()) == unparse_json(res)
+    ms = parse_json_stream([unparse_json(res)])
+    assert unparse_json(ms.read_rows()) == unparse_json(res)
+    assert list(parse_json_stream([unparse_json(spec)]).rows()) == []
+
+def test_binary():
+    """Test binary encoding and decoding"""
+    initialize_registry()
+    spec = Specification(verb=VERB_QUERY, when="2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    spec.add_parameter("destination.ip4", val="10.0.37.2")
+    for col in ("time", "delay.twoway.icmp.us", "source.ip6", 
+                "packets.lost", "connectivity.ip", "cpuload", "source.device"):
+        spec.add_result_column(col)
+    bspec = parse_binary(unparse_binary(spec))
+    assert unparse_json(bspec) == unparse_json(spec)
+
+    res = Result(specification=spec)
+    res.set_when("2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    for i in range(20):
+        res.set_result_value("time", parse_time("2014-12-24 22:18:42") + 
+                                     timedelta(microseconds=i * 999999), i)
+        res.set_result_value("delay.twoway.icmp.us", 1000 - i * 100, i)
+    res.set_result_value("source.ip6", "2001:db8:1:33::c0:ffee", 3)
+    res.set_result_value("source.ip6", "10.0.27.2", 5)
+    res.set_result_value("packets.lost", 2**70, 7)
+    for i in range(19):
+        res.set_result_value("connectivity.ip", i % 2 == 0, i)
+        res.set_result_value("cpuload", i / 3, i)
+    res.set_result_value("source.device", "eth0", 2)
+
+    bres = parse_binary(unparse_binary(res))
+    assert unparse_json(bres) == unparse_json(res)
+    assert bres._resultcolumns["delay.twoway.icmp.us"][19] == -900
+    assert len(unparse_binary(res)) < len(unparse_json(res)) / 4
+
+    res.set_result_value("time", time_now, 19)
+    bres = parse_binary(unparse_binary(res))
+    assert unparse_json(bres) == unparse_json(res)
+
+    env = Envelope()
+    env.append_message(res)
+    env.append_message(Exception(errmsg="test"))
+    benv = parse_binary(unparse_binary(env))
+    assert [unparse_json(m) for m in benv.messages()] == \
+           [unparse_json(m) for m in env.messages()]
+
+    # truncated messages are refused
+    buf = unparse_binary(env)
+    for end in range(len(BINARY_MAGIC), len(buf)):
+        try:
+            parse_binary(buf[:end])
+            assert False, "parsed truncated message"
+        except ValueError as e:
+            assert str(e) == "truncated mPlane binary message"
+
+def test_lazy_decode():
+    """Test deferred decoding of statements and envelope contents"""
+    initialize_registry()
+    spec = Specification(verb=VERB_QUERY, when="2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    spec.add_parameter("destination.ip4", val="10.0.37.2")
+    spec.add_result_column("delay.twoway.icmp.us")
+    res = Result(specification=spec)
+    res.set_when("2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    for i in range(3):
+        res.set_result_value("delay.twoway.icmp.us", i * 100, i)
+
+    lres = parse_json(unparse_json(res))
+    assert not lres.is_decoded()
+    assert lres.get_token() == res.get_token()
+    assert lres.kind_str() == KIND_RESULT
+    assert str(lres.when()) == str(res.when())
+    assert not lres.is_decoded()
+    assert lres.count_result_rows() == 3
+    assert lres.is_decoded()
+    assert unparse_json(lres) == unparse_json(res)
+
+    lres = parse_json(unparse_json(res))
+    lres.set_parameter_value("destination.ip4", "10.0.37.3")
+    assert lres.get_parameter_value("destination.ip4") == ip_address("10.0.37.3")
+    assert lres._resultcolumns["delay.twoway.icmp.us"][2] == 200
+
+    # threads reading a statement being decoded see its whole body
+    for i in range(3, 5000):
+        res.set_result_value("delay.twoway.icmp.us", i, i)
+    rows = []
+    for attempt in range(5):
+        lres = parse_json(unparse_json(res))
+        readers = [threading.Thread(target=lambda: rows.append(lres.count_result_rows()))
+                   for i in range(4)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+    assert rows == [5000] * 20
+
+    env = Envelope()
+    env.append_message(res)
+    env.append_message(Exception(errmsg="test"))
+    lenv = parse_json(unparse_json(env))
+    assert lenv.count_messages() == 2
+    assert all(isinstance(m, dict) for m in lenv._messages)
+    assert unparse_json(lenv) == unparse_json(env)
+    assert [unparse_json(m) for m in lenv.messages()] == \
+           [unparse_json(m) for m in env.messages()]
+
+def test_select():
+    """Test projection and filtering of results for redemption"""
+    initialize_registry()
+    spec = Specification(verb=VERB_QUERY, when="2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    spec.add_parameter("destination.ip4", val="10.0.37.2")
+    spec.add_result_column("time")
+    spec.add_result_column("delay.twoway.icmp.us")
+    res = Result(specification=spec)
+    res.set_when("2014-12-24 22:18:42 ... 2014-12-24 22:19:42")
+    t0 = datetime(2014, 12, 24, 22, 18, 42)
+    res._append_rows([[t0 + timedelta(seconds=i), i * 100] for i in range(5)])
+    res.set_result_value("delay.twoway.icmp.us", None, 4)
+
+    sel = res.select(["delay.twoway.icmp.us"])
+    assert list(sel.result_column_names()) == ["delay.twoway.icmp.us"]
+    assert sel._resultcolumns["delay.twoway.icmp.us"] is res._resultcolumns["delay.twoway.icmp.us"]
+    assert sel.get_token() == res.get_token()
+
+    sel = res.select(["time"], [("delay.twoway.icmp.us", ">=", "100"),
+                                ("delay.twoway.icmp.us", "<", 300)])
+    assert list(sel._resultcolumns["time"]) == [t0 + timedelta(seconds=1), 
+                                                t0 + timedelta(seconds=2)]
+    assert res.select(filters=[("delay.twoway.icmp.us", "!=", 0)]).count_result_rows() == 3
+
+    for (columns, filters) in ((["nonexistent"], None), 
+                               (None, [("delay.twoway.icmp.us", "~", "0")])):
+        try:
+            res.select(columns, filters)
+            assert False
+        except ValueError:
+            pass
+
+    rdm = Redemption(receipt=Receipt(specification=spec), cursor=2,
+                     projection=["time"], filters=[("delay.twoway.icmp.us", ">", 100)])
+    for lrdm in (parse_json(unparse_json(rdm)), parse_binary(unparse_binary(rdm))):
+        assert lrdm.get_cursor() == 2
+        assert lrdm.projection() == ["time"]
+        assert lrdm.filters() == [("delay.twoway.icmp.us", ">", "100")]
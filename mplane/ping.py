@@ -136,7 +136,7 @@ def ping6_singleton_capability(ipaddr):
     cap.add_result_column("delay.twoway.icmp.us")
     return cap
 
-class PingService(mplane.scheduler.Service):
+class PingService(mplane.scheduler.StreamingService):
     def __init__(self, cap):
         # verify the capability is acceptable
         if not ((cap.has_parameter("source.ip4") or 
@@ -151,7 +151,7 @@ class PingService(mplane.scheduler.Service):
             raise ValueError("capability not acceptable")
         super(PingService, self).__init__(cap)
 
-    def run(self, spec, check_interrupt):
+    def run(self, spec, check_interrupt, stream):
          # unpack parameters
         period = spec.when().period().total_seconds()
         duration = spec.when().duration().total_seconds()
@@ -171,52 +171,58 @@ class PingService(mplane.scheduler.Service):
         else:
             raise ValueError("Missing destination")
 
-        # read output from ping
+        # stop ping as soon as the job is interrupted
+        def kill_ping():
+            try:
+                ping_process.kill()
+            except OSError:
+                pass
+        check_interrupt.on_interrupt(kill_ping)
+
+        # derive a result from the specification; 
+        # are we returning aggregates or raw numbers?
+        res = stream.result()
+        raw = res.has_result_column("delay.twoway.icmp.us")
+        columns = list(res.result_column_names())
+
+        # read output from ping, emitting raw numbers as they arrive
         pings = []
+        first = last = None
         for line in ping_process.stdout:
             if check_interrupt():
                 break
             oneping = _parse_ping_line(line.decode("utf-8"))
             if oneping is not None:
                 print("ping "+repr(oneping))
-                pings.append(oneping)
+                if first is None:
+                    first = oneping
+                last = oneping
+                if raw:
+                    stream.append([oneping.time if col == "time" else oneping.usec 
+                                   for col in columns])
+                else:
+                    pings.append(oneping)
  
         # shut down and reap
-        try:
-            ping_process.kill()
-        except OSError:
-            pass
+        kill_ping()
         ping_process.wait()
 
-        # derive a result from the specification
-        res = mplane.model.Result(specification=spec)
-
-        # put actual start and end time into result
-        res.set_when(mplane.model.When(a = pings_start_time(pings), b = pings_end_time(pings)))
-
-        # are we returning aggregates or raw numbers?
-        if res.has_result_column("delay.twoway.icmp.us"):
-            # raw numbers
-            for i, oneping in enumerate(pings):
-                res.set_result_value("delay.twoway.icmp.us", oneping.usec, i)
-            if res.has_result_column("time"):
-                for i, oneping in enumerate(pings):
-                    res.set_result_value("time", oneping.time, i)
-        else:
+        values = {}
+        if not raw:
             # aggregates. single row.
             if res.has_result_column("delay.twoway.icmp.us.min"):
-                res.set_result_value("delay.twoway.icmp.us.min", pings_min_delay(pings))
+                values["delay.twoway.icmp.us.min"] = pings_min_delay(pings)
             if res.has_result_column("delay.twoway.icmp.us.mean"):
-                res.set_result_value("delay.twoway.icmp.us.mean", pings_mean_delay(pings))
+                values["delay.twoway.icmp.us.mean"] = pings_mean_delay(pings)
             if res.has_result_column("delay.twoway.icmp.us.median"):
-                res.set_result_value("delay.twoway.icmp.us.median", pings_median_delay(pings))
+                values["delay.twoway.icmp.us.median"] = pings_median_delay(pings)
             if res.has_result_column("delay.twoway.icmp.us.max"):
-                res.set_result_value("delay.twoway.icmp.us.max", pings_max_delay(pings))
+                values["delay.twoway.icmp.us.max"] = pings_max_delay(pings)
             if res.has_result_column("delay.twoway.icmp.us.count"):
-                res.set_result_value("delay.twoway.icmp.us.count", len(pings))
-
+                values["delay.twoway.icmp.us.count"] = len(pings)
 
-        return res
+        # put actual start and end time and aggregates into result
+        return stream.finish(mplane.model.When(a = first.time, b = last.time), values)
 
 def parse_args():
     global args
@@ -237,7 +243,8 @@ def manually_test_ping():
     spec.set_parameter_value("destination.ip4", LOOP4)
     spec.set_when("now + 5s / 1s")
 
-    res = svc.run(spec, lambda: False)
+    res = svc.run(spec, mplane.scheduler.InterruptCheck(), 
+                  mplane.scheduler.ResultStream(spec))
     print(repr(res))
     print(mplane.model.unparse_yaml(res))
 
@@ -246,7 +253,8 @@ def manually_test_ping():
     spec.set_parameter_value("destination.ip4", LOOP4)
     spec.set_when("now + 5s / 1s")
 
-    res = svc.run(spec, lambda: False)
+    res = svc.run(spec, mplane.scheduler.InterruptCheck(), 
+                  mplane.scheduler.ResultStream(spec))
     print(repr(res))
     print(mplane.model.unparse_yaml(res))
 
@@ -255,7 +263,8 @@ def manually_test_ping():
     spec.set_parameter_value("destination.ip6", LOOP6)
     spec.set_when("now + 5s / 1s")
 
-    res = svc.run(spec, lambda: False)
+    res = svc.run(spec, mplane.scheduler.InterruptCheck(), 
+                  mplane.scheduler.ResultStream(spec))
     print(repr(res))
     print(mplane.model.unparse_yaml(res))
 
@@ -264,7 +273,8 @@ def manually_test_ping():
     spec.set_parameter_value("destination.ip6", LOOP6)
     spec.set_when("now + 5s / 1s")
 
-    res = svc.run(spec, lambda: False)
+    res = svc.run(spec, mplane.scheduler.InterruptCheck(), 
+                  mplane.scheduler.ResultStream(spec))
     print(repr(res))
     print(mplane.model.unparse_yaml(res))
 
@@ -30,6 +30,16 @@ results within the mPlane reference component.
 
 from datetime import datetime, timedelta
 import threading
+import concurrent.futures
+import multiprocessing
+import asyncio
+import collections
+import queue
+import os
+import itertools
+import heapq
+import math
+import time
 import mplane.model
 import mplane.sec
 
@@ -43,9 +53,14 @@ class Service(object):
     and implement run().
 
     """
-    def __init__(self, capability):
+    def __init__(self, capability, max_concurrency=None, max_queued=None, 
+                 process=False, cache_ttl=None):
         super(Service, self).__init__()
         self._capability = capability
+        self._max_concurrency = max_concurrency
+        self._max_queued = max_queued
+        self._process = process
+        self._cache_ttl = cache_ttl
 
     def run(self, specification, check_interrupt):
         """
@@ -61,18 +76,806 @@ class Service(object):
         should call the check_interrupt function to determine whether it 
         should stop; if this function returns True, the implementation should 
         terminate its processing in an orderly fashion and return its results.
+        check_interrupt is an InterruptCheck: an implementation waiting 
+        on a subprocess or socket can also register a function with 
+        check_interrupt.on_interrupt() to release it as soon as the job
+        is interrupted.
 
         Each method will be called within its own thread and/or process. 
 
         """
         raise NotImplementedError("Cannot instantiate an abstract Service")
 
+    def runs_in_process(self):
+        """
+        Return True if this service is run in a worker process instead 
+        of a thread, for CPU-bound services. The service and specification
+        are pickled to the worker process, and the result pickled back.
+
+        """
+        return self._process
+
+    def max_concurrency(self):
+        """
+        Return the maximum number of runs of this service which may 
+        execute at once, or None for the scheduler's worker count.
+
+        """
+        return self._max_concurrency
+
+    def max_queued(self):
+        """
+        Return the maximum number of runs of this service which may wait
+        for a worker before new specifications are refused, or None for
+        the scheduler's default.
+
+        """
+        return self._max_queued
+
+    def cache_ttl(self):
+        """
+        Return the number of seconds for which Results of query 
+        specifications answered by this service may be served from the
+        scheduler's query cache, or None for the scheduler's default.
+
+        """
+        return self._cache_ttl
+
     def capability(self):
         return self._capability
 
     def __repr__(self):
         return "<Service for "+repr(self._capability)+">"
 
+class AsyncService(Service):
+    """
+    An AsyncService is a Service whose run() is a coroutine. Runs of 
+    AsyncServices are tasks on an event loop owned by the Scheduler,
+    so waiting for I/O does not occupy a thread.
+
+    To use, inherit from mplane.scheduler.AsyncService and implement
+    run() as a coroutine function.
+
+    """
+    def __init__(self, capability, max_concurrency=None, max_queued=None, 
+                 cache_ttl=None):
+        super(AsyncService, self).__init__(capability, 
+                                           max_concurrency=max_concurrency,
+                                           max_queued=max_queued,
+                                           cache_ttl=cache_ttl)
+
+    async def run(self, specification, check_interrupt):
+        """
+        Run this service given a specification which matches the capability,
+        returning a mplane.model.Result derived therefrom.
+
+        When the job is interrupted, the task running this coroutine is 
+        cancelled: asyncio.CancelledError is raised at the current await.
+        To return partial results, catch it and return the Result. 
+        check_interrupt is also available, as for a Service.
+
+        """
+        raise NotImplementedError("Cannot instantiate an abstract AsyncService")
+
+    def __repr__(self):
+        return "<AsyncService for "+repr(self._capability)+">"
+
+class StreamingService(Service):
+    """
+    A StreamingService emits result rows into its Job while it runs, 
+    instead of returning them all at the end: Redemptions of the Job 
+    return the rows emitted so far as a partial Result.
+
+    To use, inherit from mplane.scheduler.StreamingService and implement
+    run(). StreamingServices run in worker threads, not processes.
+
+    """
+    def __init__(self, capability, max_concurrency=None, max_queued=None, 
+                 cache_ttl=None):
+        super(StreamingService, self).__init__(capability, 
+                                               max_concurrency=max_concurrency,
+                                               max_queued=max_queued,
+                                               cache_ttl=cache_ttl)
+
+    def run(self, specification, check_interrupt, stream):
+        """
+        Run this service given a specification which matches the capability,
+        appending rows or batches of rows to the given ResultStream as 
+        they are produced. On return, stream.result() is the Result of 
+        the job; set its temporal scope and any aggregate values there.
+        check_interrupt is as for a Service.
+
+        """
+        raise NotImplementedError("Cannot instantiate an abstract StreamingService")
+
+    def __repr__(self):
+        return "<StreamingService for "+repr(self._capability)+">"
+
+class ResultStream(object):
+    """
+    Collects result rows emitted by a StreamingService. Rows are 
+    appended to the columns of a Result derived from the specification
+    in place, so the final Result is the one the rows were appended to;
+    snapshot() copies the rows emitted so far into a partial Result.
+
+    """
+    def __init__(self, specification):
+        super(ResultStream, self).__init__()
+        self._result = mplane.model.Result(specification=specification)
+        self._started_at = datetime.utcnow()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, row):
+        """Append a row, as a sequence of values in result column order"""
+        self.extend((row,))
+
+    def extend(self, rows):
+        """Append a batch of rows, as for append()"""
+        with self._lock:
+            self._result._append_rows(rows)
+            self._count = self._result.count_result_rows()
+
+    def result(self):
+        """Return the Result the rows are appended to"""
+        return self._result
+
+    def finish(self, when, values=None):
+        """
+        Set the temporal scope of the Result, and any values given 
+        as a mapping of result column name to value in its first row,
+        once all rows have been emitted; returns the Result. Snapshots
+        taken concurrently see all or none of these changes.
+
+        """
+        with self._lock:
+            self._result.set_when(when)
+            for (name, val) in (values or {}).items():
+                self._result.set_result_value(name, val)
+            self._count = self._result.count_result_rows()
+        return self._result
+
+    def snapshot(self, start=0):
+        """
+        Return a partial Result holding copies of the rows emitted 
+        from row start on, with its cursor set to the number of rows 
+        emitted so far.
+
+        """
+        with self._lock:
+            count = self._count
+            res = self._result.row_slice(start, count)
+        if not res.when().is_definite():
+            res.set_when(mplane.model.When(a=self._started_at, b=datetime.utcnow()),
+                         force=True)
+        res.set_cursor(count)
+        res.set_partial()
+        return res
+
+class InterruptCheck(object):
+    """
+    Passed to Service.run() as check_interrupt: calling it returns 
+    True once the job has been interrupted, by an Interrupt message or
+    at the end of the specification's temporal scope. 
+
+    Functions registered with on_interrupt() are called when the job is
+    interrupted, from the interrupting thread, so services can release 
+    processes, sockets, and file descriptors immediately instead of 
+    when they next call check_interrupt. They should be quick and 
+    thread-safe (for example, subprocess.Popen.kill).
+
+    """
+    def __init__(self, poll=None):
+        super(InterruptCheck, self).__init__()
+        self._event = threading.Event()
+        self._poll = poll
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if not self._event.is_set() and self._poll is not None and self._poll():
+            self.set()
+        return self._event.is_set()
+
+    def is_set(self):
+        return self()
+
+    def set(self):
+        """Interrupt the job, calling all registered functions"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            (callbacks, self._callbacks) = (self._callbacks, [])
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print("Got exception in interrupt callback: "+str(e))
+
+    def on_interrupt(self, fn):
+        """
+        Register a function to call with no arguments when the job is 
+        interrupted. If it has already been interrupted, fn is called
+        immediately.
+
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+class TimerHandle(object):
+    """
+    A TimerHandle refers to a function scheduled on a TimerQueue, 
+    and can be used to cancel it.
+
+    """
+    __slots__ = ('deadline', 'fn', '_queue')
+
+    def __init__(self, deadline, fn, queue):
+        super(TimerHandle, self).__init__()
+        self.deadline = deadline
+        self.fn = fn
+        self._queue = queue
+
+    def cancel(self):
+        """Cancel the call, if it has not yet been made"""
+        if self.fn is not None:
+            self._queue._cancel(self)
+
+    def cancelled(self):
+        return self.fn is None
+
+class TimerQueue(object):
+    """
+    A TimerQueue calls functions at given times from a single thread,
+    so that pending timers do not each hold an OS thread. A Scheduler 
+    owns one TimerQueue shared by all its jobs. Functions are called 
+    on the timer thread, and should hand off anything long-running 
+    to another thread.
+
+    Timers are kept in a binary heap, so scheduling takes O(log n) 
+    time. Cancellation takes O(1) time: cancelled timers are skipped
+    when they reach the top of the heap, and the heap is rebuilt 
+    when more than half of it is cancelled timers.
+
+    The queue records how late each call was made relative to its
+    deadline; see stats().
+
+    """
+    def __init__(self):
+        super(TimerQueue, self).__init__()
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._cancelled = 0
+        self._fired = 0
+        self._lateness_total = 0.0
+        self._lateness_max = 0.0
+        self._closed = False
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def call_later(self, delay, fn):
+        """Call fn after delay seconds; returns a TimerHandle"""
+        return self._push(time.monotonic() + delay, fn)
+
+    def call_at(self, t, fn):
+        """Call fn at datetime t (UTC); returns a TimerHandle"""
+        return self.call_later((t - datetime.utcnow()).total_seconds(), fn)
+
+    def _push(self, deadline, fn):
+        handle = TimerHandle(deadline, fn, self)
+        with self._cond:
+            if self._closed:
+                # a closed queue makes no more calls
+                handle.fn = None
+                return handle
+            # sequence number keeps equal deadlines in order
+            heapq.heappush(self._heap, (deadline, next(self._seq), handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, 
+                                                name="mplane-timer",
+                                                daemon=True)
+                self._thread.start()
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def _cancel(self, handle):
+        with self._cond:
+            if handle.fn is None:
+                return
+            handle.fn = None
+            self._cancelled += 1
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [e for e in self._heap if e[2].fn is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def close(self):
+        """
+        Cancel all pending calls, and stop the timer thread once any
+        call in progress returns. Later calls are not made.
+
+        """
+        with self._cond:
+            self._closed = True
+            for (deadline, seq, handle) in self._heap:
+                handle.fn = None
+            self._heap = []
+            self._cancelled = 0
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._closed:
+                        return
+                    elif len(self._heap) and self._heap[0][2].fn is None:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                    elif len(self._heap) and self._heap[0][0] <= now:
+                        break
+                    elif len(self._heap):
+                        self._cond.wait(self._heap[0][0] - now)
+                    else:
+                        self._cond.wait()
+                (deadline, seq, handle) = heapq.heappop(self._heap)
+                (fn, handle.fn) = (handle.fn, None)
+
+                lateness = now - deadline
+                self._fired += 1
+                self._lateness_total += lateness
+                if lateness > self._lateness_max:
+                    self._lateness_max = lateness
+            try:
+                fn()
+            except Exception as e:
+                print("Got exception in timer function "+repr(fn)+": "+str(e))
+
+    def stats(self):
+        """
+        Return a dictionary of statistics about this queue: the number
+        of pending timers, the number of calls made, and the mean and 
+        maximum lateness of calls in seconds.
+
+        """
+        with self._cond:
+            return { "pending": len(self),
+                     "fired": self._fired,
+                     "lateness_mean": self._lateness_total / self._fired 
+                                      if self._fired else 0.0,
+                     "lateness_max": self._lateness_max }
+
+_default_timer = None
+_defaults_lock = threading.Lock()
+
+def _default_timer_queue():
+    """Return the TimerQueue used by jobs created outside a Scheduler"""
+    global _default_timer
+    with _defaults_lock:
+        if _default_timer is None:
+            _default_timer = TimerQueue()
+        return _default_timer
+
+DEFAULT_WORKERS = 32
+DEFAULT_QUEUED = 64
+DEFAULT_REDEEMED_TTL = 60
+DEFAULT_UNREDEEMED_TTL = 3600
+DEFAULT_MAX_RESULT_BYTES = 256 * 1024 * 1024
+PRUNE_INTERVAL = 10
+DEFAULT_COALESCE_TOLERANCE = 1
+DEFAULT_QUERY_CACHE_TTL = 0
+DEFAULT_QUERY_CACHE_BYTES = 64 * 1024 * 1024
+PROCESS_POLL_INTERVAL = 0.1
+
+# interrupt flags shared with worker processes, one per worker thread
+_process_flags = None
+
+def _init_process(flags, reguri, regcache):
+    global _process_flags
+    _process_flags = flags
+    if mplane.model._registry is None and reguri is not None:
+        mplane.model.initialize_registry(reguri, cache=regcache)
+
+def _run_in_process(service, specification, slot):
+    check_interrupt = InterruptCheck(poll=lambda: _process_flags[slot] != 0)
+
+    # watch the flag, so interrupt callbacks run without polling by the service
+    finished = threading.Event()
+    def watch():
+        while not finished.wait(PROCESS_POLL_INTERVAL):
+            if check_interrupt():
+                return
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        return service.run(specification, check_interrupt)
+    finally:
+        finished.set()
+
+class WorkerPool(object):
+    """
+    A WorkerPool runs jobs on a bounded set of worker threads. 
+    Runs of each Service are limited to the service's max_concurrency() 
+    (by default, the number of workers); further runs wait in a 
+    per-service queue. The pool refuses new work for a service when 
+    its queue holds max_queued() runs (by default, the pool's 
+    max_queued); see busy().
+
+    AsyncServices are run as tasks on an event loop in a separate thread,
+    started on first use, unless a running asyncio event loop is given. 
+    Their concurrency limits are enforced with a semaphore per service.
+
+    Services which run in process (see Service.runs_in_process()) are
+    run by a pool of max_processes worker processes (by default, one 
+    per CPU), started on first use. The worker thread waits for the 
+    result, and forwards interrupts to the worker process through a 
+    shared flag.
+
+    """
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_queued=DEFAULT_QUEUED,
+                 max_processes=None, loop=None):
+        super(WorkerPool, self).__init__()
+        self._max_workers = max_workers
+        self._max_queued = max_queued
+        self._max_processes = max_processes
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self._processes = None
+        self._flags = None
+        self._slots = None
+        self._loop = loop
+        self._own_loop = False
+        self._semaphores = {}
+        self._async_waiting = collections.Counter()
+        self._lock = threading.Lock()
+        self._running = collections.Counter()
+        self._waiting = {}
+        self._runtime = {}
+
+    def _limit(self, service):
+        limit = service.max_concurrency()
+        return self._max_workers if limit is None else limit
+
+    def _depth(self, service):
+        depth = service.max_queued()
+        return self._max_queued if depth is None else depth
+
+    def queued(self, service):
+        """Return the number of runs of a service waiting for a worker"""
+        with self._lock:
+            return len(self._waiting.get(service, ()))
+
+    def busy(self, service):
+        """
+        Return None if the pool can accept more work for a service; 
+        otherwise return an estimate of the number of seconds after 
+        which it will, from the mean run time of the service.
+
+        """
+        with self._lock:
+            waiting = len(self._waiting.get(service, ())) + \
+                      self._async_waiting[service]
+            if waiting < self._depth(service):
+                return None
+            runtime = self._runtime.get(service, 1.0)
+            return max(1, math.ceil(runtime * (waiting + 1) / 
+                                    min(self._limit(service), self._max_workers)))
+
+    def submit(self, service, fn):
+        """
+        Run fn for a service on a worker thread once 
+        the service is below its concurrency limit.
+
+        """
+        with self._lock:
+            if self._running[service] < self._limit(service):
+                self._running[service] += 1
+            else:
+                self._waiting.setdefault(service, collections.deque()).append(fn)
+                return
+        self._executor.submit(self._call, service, fn)
+
+    def start(self, service, specification, check_interrupt, done, stream=None):
+        """
+        Start running a service on a specification, and call 
+        done(result, exception) from the worker thread or event loop 
+        when the run completes. For AsyncServices, returns a future 
+        whose cancel() cancels the run; returns None otherwise.
+        StreamingServices emit rows into the given ResultStream.
+
+        """
+        if isinstance(service, AsyncService):
+            done = _call_once(done)
+            started = threading.Event()
+            future = asyncio.run_coroutine_threadsafe(
+                    self._run_coroutine(service, specification, 
+                                        check_interrupt, done, started),
+                    self._event_loop())
+
+            def cancelled(future):
+                # a run cancelled before it starts never calls done itself
+                if future.cancelled() and not started.is_set():
+                    done(None, RuntimeError("Interrupted"))
+            future.add_done_callback(cancelled)
+            return future
+
+        def call():
+            try:
+                result = self.run(service, specification, check_interrupt, stream)
+            except Exception as e:
+                done(None, e)
+            else:
+                done(result, None)
+        self.submit(service, call)
+        return None
+
+    async def _run_coroutine(self, service, specification, check_interrupt, done, started):
+        started.set()
+        sem = None
+        limit = service.max_concurrency()
+        if limit is not None:
+            sem = self._semaphores.get(service)
+            if sem is None:
+                sem = self._semaphores[service] = asyncio.Semaphore(limit)
+        try:
+            if sem is not None:
+                with self._lock:
+                    self._async_waiting[service] += 1
+                try:
+                    await sem.acquire()
+                finally:
+                    with self._lock:
+                        self._async_waiting[service] -= 1
+            try:
+                result = await service.run(specification, check_interrupt)
+            finally:
+                if sem is not None:
+                    sem.release()
+        except asyncio.CancelledError:
+            done(None, RuntimeError("Interrupted"))
+        except Exception as e:
+            done(None, e)
+        else:
+            done(result, None)
+
+    def _event_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._own_loop = True
+                threading.Thread(target=self._loop.run_forever, 
+                                 name="mplane-async", daemon=True).start()
+            return self._loop
+
+    def close(self):
+        """
+        Shut down the pool's worker threads and processes, and the event
+        loop it started, without waiting for runs in progress. 
+
+        """
+        with self._lock:
+            (processes, self._processes) = (self._processes, None)
+            loop = self._loop if self._own_loop else None
+        self._executor.shutdown(wait=False)
+        if processes is not None:
+            processes.shutdown(wait=False)
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+    def run(self, service, specification, check_interrupt, stream=None):
+        """
+        Run a service on a specification, in a worker process 
+        if the service runs in process, and return its result.
+        Called from the worker thread running a job.
+
+        """
+        if isinstance(service, StreamingService):
+            if stream is None:
+                stream = ResultStream(specification)
+            result = service.run(specification, check_interrupt, stream)
+            if result is None:
+                result = stream.result()
+            return result
+
+        if not service.runs_in_process():
+            return service.run(specification, check_interrupt)
+
+        self._start_processes()
+        slot = self._slots.get()
+        try:
+            self._flags[slot] = 0
+            future = self._processes.submit(_run_in_process, 
+                                            service, specification, slot)
+            while True:
+                try:
+                    return future.result(timeout=PROCESS_POLL_INTERVAL)
+                except concurrent.futures.TimeoutError:
+                    if check_interrupt():
+                        self._flags[slot] = 1
+        finally:
+            self._slots.put(slot)
+
+    def _start_processes(self):
+        with self._lock:
+            if self._processes is not None:
+                return
+            self._flags = multiprocessing.Array('b', self._max_workers, lock=False)
+            self._slots = queue.Queue()
+            for slot in range(self._max_workers):
+                self._slots.put(slot)
+            (reguri, regcache) = (None, False)
+            if mplane.model._registry is not None:
+                reguri = mplane.model._registry._uri
+                regcache = mplane.model._registry._cache
+            self._processes = concurrent.futures.ProcessPoolExecutor(
+                                    self._max_processes, 
+                                    initializer=_init_process,
+                                    initargs=(self._flags, reguri, regcache))
+
+    def _call(self, service, fn):
+        while fn is not None:
+            start = time.monotonic()
+            try:
+                fn()
+            except Exception as e:
+                print("Got exception running "+repr(service)+": "+str(e))
+            runtime = time.monotonic() - start
+
+            # keep a moving average of run time, then take the next waiting run
+            with self._lock:
+                self._runtime[service] = \
+                    0.8 * self._runtime.get(service, runtime) + 0.2 * runtime
+                waiting = self._waiting.get(service)
+                if waiting:
+                    fn = waiting.popleft()
+                else:
+                    fn = None
+                    self._running[service] -= 1
+                    if self._running[service] == 0:
+                        del self._running[service]
+
+_default_pool = None
+
+def _default_worker_pool():
+    """Return the WorkerPool used by jobs created outside a Scheduler"""
+    global _default_pool
+    with _defaults_lock:
+        if _default_pool is None:
+            _default_pool = WorkerPool()
+        return _default_pool
+
+def _result_nbytes(result):
+    if isinstance(result, mplane.model.Statement):
+        return result.result_nbytes()
+    return 0
+
+def _call_once(fn):
+    """
+    Return a function which calls fn on its first call only.
+
+    """
+    lock = threading.Lock()
+    def call(*args):
+        if lock.acquire(False):
+            fn(*args)
+    return call
+
+def _retoken_result(result, specification):
+    """
+    Return a Result answering an equivalent specification, sharing the
+    values of the given Result but bearing the token and label of the 
+    given specification.
+
+    """
+    if not isinstance(result, mplane.model.Result):
+        return result
+    res = mplane.model.Result(specification=result)
+    res._token = specification.get_token()
+    res._label = specification.get_label()
+    res.set_when(result.when(), force=True)
+    res.set_cursor(result.get_cursor())
+    res.set_partial(result.is_partial())
+    return res
+
+class QueryCache(object):
+    """
+    Caches Results of query specifications for a limited time, so 
+    that repeated queries can be answered without running a service.
+    Results are keyed by service and specification identity (see 
+    Statement._pv_hash()), and the least recently used Results are 
+    evicted when the result values held exceed max_bytes.
+
+    """
+    def __init__(self, max_bytes=DEFAULT_QUERY_CACHE_BYTES):
+        super(QueryCache, self).__init__()
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, service, specification):
+        return (service.capability().get_token(), specification._pv_hash())
+
+    def get(self, service, specification):
+        """
+        Return a cached Result for the given specification answered 
+        by the given service, retokened for the specification, 
+        or None if there is none or it has expired.
+
+        """
+        key = self._key(service, specification)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        return _retoken_result(entry[1], specification)
+
+    def put(self, service, specification, result, ttl):
+        """
+        Cache a Result for the given specification answered by the 
+        given service for ttl seconds.
+
+        """
+        if not isinstance(result, mplane.model.Result) or not ttl:
+            return
+        nbytes = _result_nbytes(result)
+        if nbytes > self.max_bytes:
+            return
+        key = self._key(service, specification)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, result, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evicted"] += 1
+
+    def _remove(self, key):
+        # called with the lock held
+        (expires, result, nbytes) = self._entries.pop(key)
+        self._nbytes -= nbytes
+
+    def clear(self):
+        """Remove all cached Results"""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self):
+        """
+        Return a dictionary with the number of Results cached, the bytes
+        of result values they hold, and the number of cache hits, 
+        misses, and evictions to stay within max_bytes.
+
+        """
+        with self._lock:
+            return { "entries": len(self._entries),
+                     "bytes": self._nbytes,
+                     "hits": self._stats["hits"],
+                     "misses": self._stats["misses"],
+                     "evicted": self._stats["evicted"] }
+
 class Job(object):
     """
     A Job binds some running code to an mPlane.model.Specification 
@@ -80,7 +883,9 @@ class Job(object):
     instance of a Service presently running, or ready to run at some 
     point in the future.
 
-    Each Job will result in a single Result.
+    Each Job will result in a single Result. Jobs for equivalent 
+    specifications may subscribe to a Job instead of running 
+    themselves; see subscribe().
     """
     result = None
     exception = None
@@ -89,42 +894,97 @@ class Job(object):
     _ended_at = None
     _exception_at = None
     _replied_at = None
+    _redeemed_at = None
+    _nbytes = 0
     service = None
     session = None
     specification = None
     receipt = None
     _interrupt = None
+    _timer = None
+    _pool = None
+    _task = None
+    _interrupt_timer = None
+    _start_timer = None
+    _start_at = None
+    _leader = None
+    _successor = None
+    _runner = None
+    _stream = None
 
-    def __init__(self, service, specification, session=None):
+    def __init__(self, service, specification, session=None, timer=None, pool=None):
         super(Job, self).__init__()
         self.service = service
         self.session = session
         self.specification = specification
         self.receipt = mplane.model.Receipt(specification=specification)
-        self._interrupt = threading.Event()
+        self._interrupt = InterruptCheck()
+        self._completion = concurrent.futures.Future()
+        self._followers = []
+        self._lock = threading.Lock()
+        if isinstance(service, StreamingService):
+            self._stream = ResultStream(specification)
+        if timer is None:
+            timer = _default_timer_queue()
+        self._timer = timer
+        if pool is None:
+            pool = _default_worker_pool()
+        self._pool = pool
 
     def __repr__(self):
         return "<Job for "+repr(self.specification)+">"
 
-    def _run(self):
-        self._started_at = datetime.utcnow()
-        try:
-            self.result = self.service.run(self.specification, 
-                                           self._check_interrupt)
-        except Exception as e:
+    def _complete(self, result, exception):
+        # no need to interrupt a finished job
+        if self._interrupt_timer is not None:
+            self._interrupt_timer.cancel()
+
+        # pass the result on if this job handed its run on in interrupt()
+        with self._lock:
+            heir = self._successor
+            (followers, self._followers) = (self._followers, None)
+        if heir is not None:
+            heir._complete(_retoken_result(result, heir.specification), exception)
+            return
+
+        if exception is None and self._stream is not None and \
+           isinstance(result, mplane.model.Result):
+            result.set_cursor(result.count_result_rows())
+
+        # fan the result out to subscribed jobs
+        for job in followers or ():
+            if exception is None:
+                job._complete(_retoken_result(result, job.specification), None)
+            else:
+                job._complete(None, exception)
+
+        self._finish(result, exception)
+
+    def _finish(self, result, exception):
+        if exception is None:
+            self.result = result
+            self._nbytes = _result_nbytes(result)
+        else:
             self.exception = mplane.model.Exception(
                             token=self.specification.get_token(), 
-                            errmsg=str(e))
+                            errmsg=str(exception))
             print("Got exception in _run(), returning "+str(self.exception))
             self._exception_at = datetime.utcnow()
         self._ended_at = datetime.utcnow()
+        self._completion.set_result(self)
 
     def _check_interrupt(self):
         return self._interrupt.is_set()
 
     def _schedule_now(self):
-        # spawn a thread to run the service
-        threading.Thread(target=self._run).start()
+        # run the service on the worker pool, unless interrupted first
+        with self._lock:
+            if self._interrupt.is_set():
+                return
+            self._started_at = datetime.utcnow()
+        self._task = self._pool.start(self.service, self.specification,
+                                      self._interrupt, self._complete, 
+                                      self._stream)
         
     def schedule(self):
         """
@@ -138,23 +998,140 @@ class Job(object):
 
         if start_delay is None:
             return
+        self._start_at = datetime.utcnow() + timedelta(seconds=start_delay)
 
         # start interrupt timer
         if end_delay is not None:
-            threading.Timer(end_delay, self.interrupt).start()
+            self._interrupt_timer = self._timer.call_later(end_delay, self._timeout)
             print("Will interrupt "+repr(self)+" after "+str(end_delay)+" sec")
 
         # start start timer
         if start_delay > 0:            
             print("Scheduling "+repr(self)+" after "+str(start_delay)+" sec")
-            threading.Timer(start_delay, self._schedule_now).start()
+            self._start_timer = self._timer.call_later(start_delay, self._schedule_now)
         else:
             print("Scheduling "+repr(self)+" immediately")
             self._schedule_now()
 
+    def serve(self, result):
+        """
+        Complete this job with an existing Result instead of 
+        scheduling it; used to answer a specification from a cache.
+
+        """
+        self._started_at = datetime.utcnow()
+        self._start_at = self._started_at
+        self._complete(result, None)
+
+    def subscribe(self, job):
+        """
+        Subscribe a job for an equivalent specification to this job 
+        instead of scheduling it: the subscriber completes when this job
+        does, with this job's Result under its own token. Returns False
+        if this job has already completed, in which case the subscriber
+        must be scheduled itself.
+
+        """
+        with self._lock:
+            if self._followers is None:
+                return False
+            self._followers.append(job)
+        job._leader = self
+        job._started_at = self._started_at
+        job._start_at = self._start_at
+        return True
+
+    def start_time(self):
+        """
+        Return the time at which this job was scheduled to start,
+        or None if it has not been scheduled.
+
+        """
+        return self._start_at
+
+    def unsubscribe(self, job):
+        """
+        Unsubscribe a job from this job. Returns False if this job 
+        has already completed the subscriber.
+
+        """
+        with self._lock:
+            heir = self._successor
+            if heir is None:
+                if self._followers is None or job not in self._followers:
+                    return False
+                self._followers.remove(job)
+                return True
+        return heir.unsubscribe(job)
+
     def interrupt(self):
-        """Interrupt this job."""
+        """
+        Interrupt this job. A job which has not yet started fails 
+        immediately. A job subscribed to another is unsubscribed and 
+        fails without interrupting the other job. A job with subscribers
+        hands its run on to the first of them and fails, so that the 
+        subscribers' results are not cut short; otherwise the run is 
+        stopped, and the job completes with its partial result.
+
+        """
+        leader = self._leader
+        if leader is not None:
+            if leader.unsubscribe(self):
+                self._finish(None, RuntimeError("Interrupted"))
+            return
+        with self._lock:
+            if self._successor is not None:
+                return
+            heir = None
+            if self._followers:
+                heir = self._followers.pop(0)
+                heir._succeed(self, self._followers)
+                self._successor = heir
+            self._followers = None
+        if heir is not None:
+            print("Handing run of "+repr(self)+" on to "+repr(heir))
+            self._finish(None, RuntimeError("Interrupted"))
+        else:
+            self._stop()
+
+    def _succeed(self, job, followers):
+        # take over the run of the job this job subscribed to, with its
+        # remaining subscribers; called from job.interrupt() with job's
+        # lock held
+        with self._lock:
+            self._followers = followers
+        self._leader = None
+        self._runner = job._runner or job
+        self._interrupt = job._interrupt
+        self._stream = job._stream
+        for follower in followers:
+            follower._leader = self
+
+    def _stop(self):
+        # stop the run this job holds, or cancel it if not yet started
+        runner = self._runner or self
+        with runner._lock:
+            pending = runner._started_at is None and not self._interrupt.is_set()
+            if pending:
+                self._interrupt.set()
+        if pending:
+            if runner._start_timer is not None:
+                runner._start_timer.cancel()
+            self._complete(None, RuntimeError("Interrupted"))
+            return
         self._interrupt.set()
+        if runner._task is not None:
+            runner._task.cancel()
+
+    def _timeout(self):
+        # the end of the specification's temporal scope stops the run
+        # for all subscribers, whichever job now holds it
+        with self._lock:
+            heir = self._successor
+        if heir is not None:
+            heir._timeout()
+        else:
+            self._stop()
 
     def failed(self):
         return self.exception is not None
@@ -163,18 +1140,251 @@ class Job(object):
         """Return True if the job is complete."""
         return self.result is not None
 
-    def get_reply(self):
+    def completed(self):
+        """Return True if the job has finished or failed."""
+        return self._ended_at is not None
+
+    def completion(self):
+        """
+        Return a concurrent.futures.Future which resolves to this job 
+        when it has finished or failed.
+
+        """
+        return self._completion
+
+    def nbytes(self):
+        """Return the approximate number of bytes held in result values."""
+        return self._nbytes
+
+    def _partial_result(self, cursor):
+        # rows streamed so far by this job, or the job it subscribes to
+        if self._stream is not None:
+            stream = self._stream
+        elif self._leader is not None and self._leader._stream is not None:
+            stream = self._leader._stream
+        else:
+            return None
+        if len(stream) == 0:
+            return None
+        return _retoken_result(stream.snapshot(cursor or 0), self.specification)
+
+    def get_reply(self, cursor=None):
         """
         If a result is available for this Job (i.e., if the job is 
-        done running), return it. Otherwise, create a receipt from 
-        the Specification and return that.
+        done running), return it. Otherwise, return a partial result 
+        holding the rows a StreamingService has emitted so far, if any,
+        or the receipt for the Specification.
+
+        If a cursor (a count of rows the client already has) is given,
+        results hold only the rows after the cursor, and carry the 
+        cursor to present with the next redemption.
 
         """
         self._replied_at = datetime.utcnow()
         if self.failed():
+            self._redeemed_at = self._replied_at
             return self.exception
         elif self.finished():
-            return self.result
+            self._redeemed_at = self._replied_at
+            if cursor is None or not isinstance(self.result, mplane.model.Result):
+                return self.result
+            reply = self.result.row_slice(cursor)
+            reply.set_cursor(self.result.count_result_rows())
+            return reply
+        partial = self._partial_result(cursor)
+        if partial is not None:
+            return partial
+        return self.receipt
+
+class MultiJob(object):
+    """
+    A MultiJob binds some running code to an mplane.model.Specification
+    with a Schedule: the Service is run once for each datetime generated
+    by the Schedule, and the Result of each run is collected. Runs are
+    started from the Scheduler's TimerQueue, so a MultiJob holds no 
+    thread between runs.
+
+    Redeeming a MultiJob returns an Envelope holding the Results 
+    collected so far, or the Receipt if there are none yet. Runs which
+    fail are counted, but only fail the job if no run succeeds.
+
+    """
+    def __init__(self, service, specification, session=None, timer=None, pool=None):
+        super(MultiJob, self).__init__()
+        self.service = service
+        self.session = session
+        self.specification = specification
+        self.receipt = mplane.model.Receipt(specification=specification)
+        self.results = []
+        self.exception = None
+        self._failed_runs = 0
+        if timer is None:
+            timer = _default_timer_queue()
+        self._timer = timer
+        if pool is None:
+            pool = _default_worker_pool()
+        self._pool = pool
+        self._next_timer = None
+        self._tasks = []
+        self._checks = set()
+        self._interrupt = threading.Event()
+        self._completion = concurrent.futures.Future()
+        self._iterator = None
+        self._running = 0
+        self._done = False
+        self._lock = threading.Lock()
+        self._replied_at = None
+        self._redeemed_at = None
+        self._ended_at = None
+        self._nbytes = 0
+
+    def __repr__(self):
+        return "<MultiJob for "+repr(self.specification)+">"
+
+    def schedule(self):
+        """
+        Schedule the first run of this job. The time of the first run 
+        is found on the TimerQueue, as searching a sparse schedule may 
+        take a while.
+        """
+        self._iterator = self.specification.schedule().datetime_iterator()
+        self._next_timer = self._timer.call_later(0, self._schedule_next)
+
+    def _schedule_next(self):
+        t = None
+        if not self._interrupt.is_set():
+            t = next(self._iterator, None)
+        if t is None:
+            print(repr(self)+" has no more runs scheduled")
+            with self._lock:
+                self._set_done()
+        else:
+            self._next_timer = self._timer.call_at(t, self._fire)
+            # interrupt() may have cancelled the previous timer meanwhile
+            if self._interrupt.is_set():
+                self._next_timer.cancel()
+
+    def _fire(self):
+        # schedule the next run first, so runs do not delay each other
+        check = InterruptCheck()
+        with self._lock:
+            if self._interrupt.is_set():
+                return
+            self._running += 1
+            self._checks.add(check)
+        self._schedule_next()
+
+        def done(result, exception):
+            with self._lock:
+                self._checks.discard(check)
+            self._complete(result, exception)
+
+        task = self._pool.start(self.service, self.specification, check, done)
+        if task is not None:
+            with self._lock:
+                self._tasks = [t for t in self._tasks if not t.done()]
+                self._tasks.append(task)
+
+    def _complete(self, result, exception):
+        with self._lock:
+            if exception is None:
+                self.results.append(result)
+                self._nbytes += _result_nbytes(result)
+            else:
+                self.exception = mplane.model.Exception(
+                                token=self.specification.get_token(), 
+                                errmsg=str(exception))
+                self._failed_runs += 1
+                print("Got exception in _run(), returning "+str(self.exception))
+            self._ended_at = datetime.utcnow()
+            self._running -= 1
+            if self._done:
+                self._set_done()
+
+    def _set_done(self):
+        # called with the lock held; resolve completion after the last run
+        self._done = True
+        self._ended_at = datetime.utcnow()
+        if self._running == 0 and not self._completion.done():
+            self._completion.set_result(self)
+
+    def _check_interrupt(self):
+        return self._interrupt.is_set()
+
+    def interrupt(self):
+        """
+        Interrupt this job, cancelling all further runs. A job 
+        interrupted before any run has started fails immediately.
+
+        """
+        self._interrupt.set()
+        if self._next_timer is not None:
+            self._next_timer.cancel()
+        with self._lock:
+            checks = list(self._checks)
+            for task in self._tasks:
+                task.cancel()
+            if self._running == 0 and len(self.results) == 0 and \
+               self.exception is None:
+                self.exception = mplane.model.Exception(
+                                token=self.specification.get_token(), 
+                                errmsg="Interrupted")
+            self._set_done()
+        for check in checks:
+            check.set()
+
+    def failed(self):
+        """Return True if no runs of the job remain, and none succeeded."""
+        return self.finished() and len(self.results) == 0 and \
+               self.exception is not None
+
+    def failed_runs(self):
+        """Return the number of runs of this job which failed."""
+        return self._failed_runs
+
+    def finished(self):
+        """Return True if no runs of the job remain."""
+        return self._done and self._running == 0
+
+    def completed(self):
+        """Return True if no runs of the job remain."""
+        return self.finished()
+
+    def completion(self):
+        """
+        Return a concurrent.futures.Future which resolves to this job 
+        when no runs of it remain.
+
+        """
+        return self._completion
+
+    def nbytes(self):
+        """Return the approximate number of bytes held in result values."""
+        return self._nbytes
+
+    def get_reply(self, cursor=None):
+        """
+        Return an Envelope containing the Results collected so far if 
+        there are any, the Exception of the last failed run if no runs 
+        remain and none succeeded, or the Receipt otherwise. Failed runs
+        are not reported in the Envelope; see failed_runs(). The 
+        Envelope's cursor is the number of Results collected; if a cursor
+        is given, the Envelope holds only the Results collected after it.
+
+        """
+        self._replied_at = datetime.utcnow()
+        if self.failed():
+            self._redeemed_at = self._replied_at
+            return self.exception
+        with self._lock:
+            results = list(self.results)
+        if len(results):
+            self._redeemed_at = self._replied_at
+            env = mplane.model.Envelope(content_type=mplane.model.ENVELOPE_STATEMENT)
+            env.set_cursor(len(results))
+            for result in results[cursor or 0:]:
+                env.append_message(result)
+            return env
         else:
             return self.receipt
 
@@ -185,27 +1395,108 @@ class Scheduler(object):
     Capabilities with add_service(), and submit jobs for scheduling using
     submit_job().
 
+    Jobs run on a WorkerPool of at most max_workers threads. A 
+    specification is refused with a "busy" Exception if max_queued 
+    runs of its service are already waiting for a worker (unless the
+    service sets its own limits). AsyncServices run on the given running
+    asyncio event loop, or on one the scheduler starts in its own thread.
+
+    Completed jobs are removed every PRUNE_INTERVAL seconds by 
+    prune_jobs(), according to redeemed_ttl, unredeemed_ttl, and 
+    max_result_bytes.
+
+    A single-run specification equivalent to that of a job which has 
+    not yet completed (with the same parameter values and result 
+    columns, the same duration, and a start time within 
+    coalesce_tolerance seconds) is coalesced onto that job rather than 
+    run again: each receipt is redeemed for the same Result under its
+    own token. Set coalesce_tolerance to None to run every 
+    specification separately.
+
+    Results of query specifications are cached for the service's 
+    cache_ttl seconds (query_cache_ttl if the service does not set it;
+    by default, no caching), and repeated queries within this time are
+    answered from the cache without running the service. Cached Results
+    are bounded to query_cache_bytes of result values.
+
     """
-    def __init__(self, security):
+    def __init__(self, security, max_workers=DEFAULT_WORKERS, max_queued=DEFAULT_QUEUED,
+                 loop=None, redeemed_ttl=DEFAULT_REDEEMED_TTL, 
+                 unredeemed_ttl=DEFAULT_UNREDEEMED_TTL,
+                 max_result_bytes=DEFAULT_MAX_RESULT_BYTES,
+                 coalesce_tolerance=DEFAULT_COALESCE_TOLERANCE,
+                 query_cache_ttl=DEFAULT_QUERY_CACHE_TTL,
+                 query_cache_bytes=DEFAULT_QUERY_CACHE_BYTES):
         super(Scheduler, self).__init__()
         self.services = []
         self.jobs = {}
+        self._jobs_lock = threading.Lock()
+        self.coalesce_tolerance = coalesce_tolerance
+        self._coalescing = {}
+        self._coalesced = 0
+        self.query_cache_ttl = query_cache_ttl
+        self._query_cache = QueryCache(query_cache_bytes)
+        self.redeemed_ttl = redeemed_ttl
+        self.unredeemed_ttl = unredeemed_ttl
+        self.max_result_bytes = max_result_bytes
+        self._pruned = collections.Counter()
+        self._result_bytes = 0
         self._capability_cache = {}
+        self._capability_index = {}
+        self._timer = TimerQueue()
+        self._pool = WorkerPool(max_workers, max_queued, loop=loop)
         self.ac = mplane.sec.Authorization(security)
+        self._prune_timer = self._timer.call_later(PRUNE_INTERVAL, 
+                                                   self._prune_periodically)
+
+    def close(self):
+        """
+        Stop this scheduler: cancel periodic pruning, and shut down its 
+        timer thread and worker pool. Runs in progress are not waited 
+        for, and jobs not yet started never run.
 
-    def receive_message(self, user, msg, session=None):
+        """
+        self._prune_timer.cancel()
+        self._timer.close()
+        self._pool.close()
+
+    def receive_message(self, user, msg, session=None, wait=None):
         """
         Receive and process a message. 
         Returns a message to send in reply.
 
+        If wait is given, a Redemption for a job which has not yet 
+        completed blocks for up to wait seconds for the job to complete.
+        If the Redemption carries a cursor, only results produced after
+        the cursor are returned; see redeem().
+
+        An Interrupt interrupts the matching job; the reply is the job's
+        Result if it has already completed, or its Receipt, which can be
+        redeemed for the partial Result.
+
         """
         reply = None
         if isinstance(msg, mplane.model.Specification):
             reply = self.submit_job(user, specification=msg, session=session)
         elif isinstance (msg, mplane.model.Redemption):
             job_key = msg.get_token()
-            if job_key in self.jobs:
-                reply = self.jobs[job_key].get_reply()
+            job = self.jobs.get(job_key)
+            if job is not None:
+                if wait and not job.completed():
+                    try:
+                        job.completion().result(timeout=wait)
+                    except concurrent.futures.TimeoutError:
+                        pass
+                reply = self.redeem(job, msg)
+            else: reply = mplane.model.Exception(token=job_key, 
+                errmsg="Unknown job")
+        elif isinstance (msg, mplane.model.Interrupt):
+            job_key = msg.get_token()
+            job = self.jobs.get(job_key)
+            if job is not None:
+                print("Interrupting "+repr(job))
+                job.interrupt()
+                reply = job.get_reply()
             else: reply = mplane.model.Exception(token=job_key, 
                 errmsg="Unknown job")
         else:
@@ -214,12 +1505,59 @@ class Scheduler(object):
 
         return reply
 
+    def redeem(self, job, redemption):
+        """
+        Return the reply to a Redemption for a job: only results after 
+        the Redemption's cursor (see Job.get_reply()), holding only the 
+        result columns and rows it selects (see Result.select()), 
+        so that only these are serialized. Returns an Exception if the
+        Redemption names unknown columns or operators.
+
+        """
+        reply = job.get_reply(redemption.get_cursor())
+        if not redemption.is_selective():
+            return reply
+        try:
+            if isinstance(reply, mplane.model.Result):
+                return reply.select(redemption.projection(), redemption.filters())
+            elif isinstance(reply, mplane.model.Envelope):
+                env = mplane.model.Envelope(content_type=reply._content_type)
+                env.set_cursor(reply.get_cursor())
+                for result in reply.messages():
+                    env.append_message(result.select(redemption.projection(), 
+                                                     redemption.filters()))
+                return env
+        except (ValueError, TypeError) as e:
+            return mplane.model.Exception(token=redemption.get_token(), errmsg=str(e))
+        return reply
+
+    def _index_key(self, statement):
+        return (statement._schema_hash(), statement.verb())
+
     def add_service(self, service):
         """Add a service to this Scheduler"""
         print("Added "+repr(service))
         self.services.append(service)
         cap = service.capability()
         self._capability_cache[cap.get_token()] = cap
+        self._capability_index.setdefault(self._index_key(cap), []).append(service)
+
+    def remove_service(self, service):
+        """
+        Remove a service from this Scheduler, withdrawing its capability.
+        Jobs already running for the service are not affected.
+
+        """
+        print("Removed "+repr(service))
+        self.services.remove(service)
+        cap = service.capability()
+        self._capability_cache.pop(cap.get_token(), None)
+        key = self._index_key(cap)
+        candidates = self._capability_index.get(key, [])
+        if service in candidates:
+            candidates.remove(service)
+        if len(candidates) == 0:
+            self._capability_index.pop(key, None)
 
     def capability_keys(self):
         """
@@ -242,8 +1580,9 @@ class Scheduler(object):
         a new Job to execute the statement. 
 
         """
-        # linearly search the available services
-        for service in self.services:
+        # look up services by schema and verb, then check temporal scope
+        candidates = self._capability_index.get(self._index_key(specification), [])
+        for service in candidates:
             if specification.fulfills(service.capability()):
                 if self.ac.check_azn(service.capability()._label, user):
 		            # Found. Create a new job.
@@ -251,22 +1590,58 @@ class Scheduler(object):
                     if (specification.has_schedule()):
                         new_job = MultiJob(service=service,
 		                                   specification=specification,
-		                                   session=session)
+		                                   session=session,
+		                                   timer=self._timer,
+		                                   pool=self._pool)
                     else:
                         new_job = Job(service=service,
 		                              specification=specification,
-		                              session=session)
+		                              session=session,
+		                              timer=self._timer,
+		                              pool=self._pool)
 
-                    # Key by the receipt's token, and return
+                    # Key by the receipt's token; if the job is already 
+                    # running, return its receipt
                     job_key = new_job.receipt.get_token()
-                    if job_key in self.jobs:
-                        # Job already running. Return receipt
-                        print(repr(self.jobs[job_key])+" already running")
-                        return self.jobs[job_key].receipt
+                    with self._jobs_lock:
+                        old_job = self.jobs.get(job_key)
+                    if old_job is not None:
+                        print(repr(old_job)+" already running")
+                        return old_job.receipt
+
+                    # Look for a cached result or an equivalent job to
+                    # coalesce onto, else refuse if the service is too busy.
+                    cached = None
+                    if specification.is_query() and self._cache_ttl(service):
+                        cached = self._query_cache.get(service, specification)
+                    leader = None
+                    if cached is None:
+                        leader = self._coalescing_job(service, specification)
+                    retry = None
+                    if cached is None and leader is None:
+                        retry = self._pool.busy(service)
+                    if retry is not None:
+                        print(repr(service)+" busy, refusing "+repr(specification))
+                        return mplane.model.Exception(token=specification.get_token(),
+                                    errmsg="busy, retry after "+str(retry)+" s")
+
+                    # Answer from the cache, subscribe to an equivalent job, 
+                    # or schedule
+                    if cached is not None:
+                        print("Answering "+repr(new_job)+" from cache")
+                        new_job.serve(cached)
+                    elif leader is not None and leader.subscribe(new_job):
+                        print("Coalesced "+repr(new_job)+" onto "+repr(leader))
+                        with self._jobs_lock:
+                            self._coalesced += 1
+                    else:
+                        new_job.schedule()
+                        self._add_coalescing_job(new_job)
+                        self._add_caching_job(new_job)
 
                     # Keep track of the job and return receipt
-                    new_job.schedule()
-                    self.jobs[job_key] = new_job
+                    with self._jobs_lock:
+                        self.jobs[job_key] = new_job
                     print("Returning "+repr(new_job.receipt))
                     return new_job.receipt
                     
@@ -280,6 +1655,101 @@ class Scheduler(object):
         return mplane.model.Exception(token=specification.get_token(),
                     errmsg="No service registered for specification")
 
+    def _coalescing_key(self, specification):
+        if self.coalesce_tolerance is None or specification.has_schedule():
+            return None
+        return specification._pvd_hash()
+
+    def _coalescing_job(self, service, specification):
+        """
+        Return a job which has not yet completed for the given service, 
+        whose specification is equivalent to the given one and starts 
+        within coalesce_tolerance seconds of it, or None.
+
+        """
+        key = self._coalescing_key(specification)
+        if key is None:
+            return None
+
+        if specification.is_query():
+            start = None
+        else:
+            (start_delay, end_delay) = specification.when().timer_delays()
+            if start_delay is None:
+                return None
+            start = datetime.utcnow() + timedelta(seconds=start_delay)
+
+        with self._jobs_lock:
+            candidates = list(self._coalescing.get(key, ()))
+        for job in candidates:
+            if job.service is not service or job.completed():
+                continue
+            if start is None or abs((job.start_time() - start).total_seconds()) \
+                                <= self.coalesce_tolerance:
+                return job
+        return None
+
+    def _add_coalescing_job(self, job):
+        # index a scheduled job for coalescing until it completes
+        key = self._coalescing_key(job.specification)
+        if key is None or job.start_time() is None:
+            return
+        with self._jobs_lock:
+            self._coalescing.setdefault(key, []).append(job)
+
+        def remove(future):
+            with self._jobs_lock:
+                jobs = self._coalescing.get(key, [])
+                if job in jobs:
+                    jobs.remove(job)
+                if len(jobs) == 0:
+                    self._coalescing.pop(key, None)
+            # a job interrupted with subscribers hands its run on
+            if job._successor is not None:
+                self._add_coalescing_job(job._successor)
+        job.completion().add_done_callback(remove)
+
+    def _cache_ttl(self, service):
+        ttl = service.cache_ttl()
+        if ttl is None:
+            ttl = self.query_cache_ttl
+        return ttl
+
+    def _add_caching_job(self, job):
+        # cache the result of a query job when it completes
+        ttl = self._cache_ttl(job.service)
+        if not ttl or not job.specification.is_query() or \
+           not isinstance(job, Job):
+            return
+
+        def cache(future):
+            # don't cache partial results of interrupted queries
+            if job.finished() and not job._check_interrupt():
+                self._query_cache.put(job.service, job.specification, 
+                                      job.result, ttl)
+            elif job._successor is not None:
+                self._add_caching_job(job._successor)
+        job.completion().add_done_callback(cache)
+
+    def query_cache_stats(self):
+        """
+        Return statistics about this Scheduler's query result cache;
+        see QueryCache.stats().
+
+        """
+        return self._query_cache.stats()
+
+    def coalesce_stats(self):
+        """
+        Return a dictionary with the number of jobs which may presently 
+        be coalesced onto, and the number of jobs which have been 
+        coalesced onto another rather than run.
+
+        """
+        with self._jobs_lock:
+            return { "coalescing": sum(len(jobs) for jobs in self._coalescing.values()),
+                     "coalesced": self._coalesced }
+
     def job_for_message(self, msg):
         """
         Given a message (generally a Redemption), 
@@ -288,11 +1758,720 @@ class Scheduler(object):
         """
         return self.jobs[msg.get_token()]
 
-    def prune_jobs(self):
+    def timer_stats(self):
+        """
+        Return statistics about scheduling lateness of this 
+        Scheduler's jobs; see TimerQueue.stats().
+
+        """
+        return self._timer.stats()
+
+    def prune_jobs(self, now=None):
         """
-        Currently does nothing. Will remove Jobs which are 
-        finished and whose Results have been retrieved 
-        from the scheduler in a future version.
+        Remove completed jobs whose results were redeemed more than 
+        redeemed_ttl seconds ago, or which have not been redeemed 
+        within unredeemed_ttl seconds of completing. Then remove the 
+        least recently completed or redeemed jobs until the result 
+        values held by the remaining jobs fit within max_result_bytes.
+        Called periodically by the scheduler. Returns the number
+        of jobs removed.
 
         """
-        pass
+        if now is None:
+            now = datetime.utcnow()
+        redeemed_limit = now - timedelta(seconds=self.redeemed_ttl)
+        unredeemed_limit = now - timedelta(seconds=self.unredeemed_ttl)
+
+        with self._jobs_lock:
+            candidates = [(k, j) for (k, j) in self.jobs.items() if j.completed()]
+
+        # expire by age
+        prune = {}
+        retained = []
+        for (key, job) in candidates:
+            if job._redeemed_at is not None and job._redeemed_at >= job._ended_at:
+                if job._redeemed_at < redeemed_limit:
+                    prune[key] = "redeemed"
+                    continue
+                last_used = job._redeemed_at
+            elif job._ended_at < unredeemed_limit:
+                prune[key] = "unredeemed"
+                continue
+            else:
+                last_used = job._ended_at
+            retained.append((last_used, key, job))
+
+        # then evict least recently used until under budget
+        held = sum(job.nbytes() for (last_used, key, job) in retained)
+        retained.sort(key=lambda t: t[0])
+        for (last_used, key, job) in retained:
+            if held <= self.max_result_bytes:
+                break
+            prune[key] = "lru"
+            held -= job.nbytes()
+
+        with self._jobs_lock:
+            for (key, reason) in prune.items():
+                if self.jobs.pop(key, None) is not None:
+                    self._pruned[reason] += 1
+            self._result_bytes = held
+
+        if len(prune):
+            print("Pruned "+str(len(prune))+" jobs, "+str(held)+" result bytes held")
+        return len(prune)
+
+    def _prune_periodically(self):
+        try:
+            self.prune_jobs()
+        finally:
+            self._prune_timer = self._timer.call_later(PRUNE_INTERVAL, 
+                                                       self._prune_periodically)
+
+    def retention_stats(self):
+        """
+        Return a dictionary of statistics about job retention: the 
+        number of jobs held, bytes of result values held by completed 
+        jobs as of the last pruning, and the number of jobs pruned after
+        redemption, without redemption, and to stay within the byte budget.
+
+        """
+        with self._jobs_lock:
+            return { "jobs": len(self.jobs),
+                     "result_bytes": self._result_bytes,
+                     "pruned_redeemed": self._pruned["redeemed"],
+                     "pruned_unredeemed": self._pruned["unredeemed"],
+                     "pruned_lru": self._pruned["lru"] }
+
+class _TestService(Service):
+    def run(self, specification, check_interrupt):
+        res = mplane.model.Result(specification=specification)
+        res.set_when(mplane.model.When(a=datetime(2014, 12, 24, 22, 18, 42)), force=True)
+        for i in range(3):
+            res.set_result_value("delay.twoway.icmp.us", i * 100, i)
+        return res
+
+def _test_capability(source, verb=mplane.model.VERB_MEASURE):
+    cap = mplane.model.Capability(verb=verb, label="test-"+source, 
+                                  when="now ... future / 1s")
+    cap.add_parameter("source.ip4", source)
+    cap.add_parameter("destination.ip4")
+    cap.add_result_column("delay.twoway.icmp.us")
+    return cap
+
+def _test_specification(cap, when="now + 1s / 1s"):
+    spec = mplane.model.Specification(capability=cap)
+    spec.set_single_values()
+    spec.set_parameter_value("destination.ip4", "10.0.37.2")
+    spec.set_when(when)
+    return spec
+
+def test_capability_index():
+    """Test indexed capability matching"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svcs = [_TestService(_test_capability("10.0.27."+str(i))) for i in range(3)]
+    qsvc = _TestService(_test_capability("10.0.27.1", mplane.model.VERB_QUERY))
+    for svc in svcs + [qsvc]:
+        scheduler.add_service(svc)
+    assert len(scheduler._capability_index) == 2
+
+    spec = _test_specification(qsvc.capability())
+    reply = scheduler.submit_job(None, spec)
+    assert isinstance(reply, mplane.model.Receipt)
+    assert scheduler.job_for_message(reply).service is qsvc
+
+    spec = _test_specification(svcs[0].capability())
+    reply = scheduler.submit_job(None, spec)
+    assert scheduler.job_for_message(reply).service is svcs[0]
+
+    scheduler.remove_service(qsvc)
+    assert len(scheduler._capability_index) == 1
+    spec = _test_specification(qsvc.capability(), when="now + 2s / 1s")
+    reply = scheduler.submit_job(None, spec)
+    assert isinstance(reply, mplane.model.Exception)
+    scheduler.close()
+
+class _FailingService(Service):
+    def __init__(self, capability, fail):
+        super(_FailingService, self).__init__(capability)
+        self._runs = itertools.count()
+        self._fail = fail
+
+    def run(self, specification, check_interrupt):
+        if self._fail(next(self._runs)):
+            raise RuntimeError("run failed")
+        return _TestService.run(self, specification, check_interrupt)
+
+def test_multijob():
+    """Test repeated runs of scheduled specifications"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _TestService(_test_capability("10.0.27.1"))
+    scheduler.add_service(svc)
+
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(seconds=1)
+    sched = mplane.model.Schedule(when=mplane.model.When(
+                    a=start, b=start + timedelta(seconds=2)))
+    spec = _test_specification(svc.capability(), when="now + 10s / 1s")
+    spec._schedule = sched
+    reply = scheduler.submit_job(None, spec)
+    assert isinstance(reply, mplane.model.Receipt)
+    job = scheduler.job_for_message(reply)
+    assert isinstance(job, MultiJob)
+    # the first run, and pruning
+    assert len(scheduler._timer) == 2
+
+    assert job.completion().result(timeout=10) is job
+    assert job.finished()
+    env = scheduler.receive_message(None, mplane.model.Redemption(receipt=reply))
+    assert isinstance(env, mplane.model.Envelope)
+    assert env.count_messages() == 3 and env.get_cursor() == 3
+    assert all(isinstance(m, mplane.model.Result) for m in env.messages())
+    env = scheduler.receive_message(None, mplane.model.Redemption(receipt=reply, cursor=2))
+    assert env.count_messages() == 1 and env.get_cursor() == 3
+    env = mplane.model.parse_binary(mplane.model.unparse_binary(env))
+    assert env.get_cursor() == 3
+    scheduler.close()
+
+    # failed runs don't discard the results of the others
+    (jobs, schedulers) = ([], [])
+    for fail in (lambda run: run == 1, lambda run: True):
+        scheduler = Scheduler(security=False)
+        schedulers.append(scheduler)
+        fsvc = _FailingService(_test_capability("10.0.27.1"), fail)
+        scheduler.add_service(fsvc)
+        start = datetime.utcnow().replace(microsecond=0) + timedelta(seconds=1)
+        spec = _test_specification(fsvc.capability(), when="now + 10s / 1s")
+        spec._schedule = mplane.model.Schedule(when=mplane.model.When(
+                        a=start, b=start + timedelta(seconds=2)))
+        jobs.append(scheduler.job_for_message(scheduler.submit_job(None, spec)))
+    for job in jobs:
+        job.completion().result(timeout=10)
+    env = jobs[0].get_reply()
+    assert isinstance(env, mplane.model.Envelope) and env.count_messages() == 2
+    assert not jobs[0].failed() and jobs[0].failed_runs() == 1
+    assert isinstance(jobs[1].get_reply(), mplane.model.Exception)
+    assert jobs[1].failed() and jobs[1].failed_runs() == 3
+    for scheduler in schedulers:
+        scheduler.close()
+
+def test_timer_queue():
+    """Test timer ordering, cancellation, and lateness statistics"""
+    timer = TimerQueue()
+    fired = []
+    done = threading.Event()
+    timer.call_later(0.2, lambda: fired.append(2))
+    timer.call_later(0.1, lambda: fired.append(1))
+    handles = [timer.call_later(0.15, lambda: fired.append(0)) for i in range(10)]
+    timer.call_later(0.3, done.set)
+    assert len(timer) == 13
+    for handle in handles:
+        handle.cancel()
+    assert handles[0].cancelled()
+    assert len(timer) == 3
+    assert done.wait(5)
+    assert fired == [1, 2]
+
+    stats = timer.stats()
+    assert stats["fired"] == 3
+    assert stats["pending"] == 0
+    assert 0 <= stats["lateness_mean"] <= stats["lateness_max"]
+
+    # closing cancels pending calls and stops the timer thread
+    handle = timer.call_later(60, lambda: fired.append(3))
+    thread = timer._thread
+    timer.close()
+    assert handle.cancelled() and len(timer) == 0
+    thread.join(5)
+    assert not thread.is_alive()
+    assert timer.call_later(0, lambda: fired.append(4)).cancelled()
+
+def test_job_interrupt_timer():
+    """Test that finished jobs cancel their interrupt timers"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _TestService(_test_capability("10.0.27.1"))
+    scheduler.add_service(svc)
+    spec = _test_specification(svc.capability(), when="now + 1m / 1s")
+    job = scheduler.job_for_message(scheduler.submit_job(None, spec))
+
+    assert job.completion().result(timeout=5) is job
+    assert job.finished()
+    assert job._interrupt_timer.cancelled()
+    # only the pruning timer remains
+    assert len(scheduler._timer) == 1
+
+    # jobs interrupted before they start fail at once
+    spec = _test_specification(svc.capability(), when=mplane.model.When(
+                    a=datetime.utcnow() + timedelta(minutes=1),
+                    d=timedelta(minutes=1), p=timedelta(seconds=1)))
+    job = scheduler.job_for_message(scheduler.submit_job(None, spec))
+    job.interrupt()
+    assert job.completion().done()
+    assert isinstance(job.get_reply(), mplane.model.Exception)
+    assert job._start_timer.cancelled()
+
+    start = datetime.utcnow() + timedelta(minutes=1)
+    spec = _test_specification(svc.capability(), when="now + 10m / 1s")
+    spec._schedule = mplane.model.Schedule(when=mplane.model.When(
+                    a=start, b=start + timedelta(seconds=2)))
+    job = scheduler.job_for_message(scheduler.submit_job(None, spec))
+    assert isinstance(job, MultiJob)
+    job.interrupt()
+    assert job.completion().done()
+    assert isinstance(job.get_reply(), mplane.model.Exception)
+    assert len(scheduler._timer) == 1
+    scheduler.close()
+    assert scheduler._prune_timer.cancelled() and len(scheduler._timer) == 0
+
+class _BlockingService(Service):
+    def __init__(self, capability, **kwargs):
+        super(_BlockingService, self).__init__(capability, **kwargs)
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def run(self, specification, check_interrupt):
+        with self._lock:
+            self.runs += 1
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+        return _TestService.run(self, specification, check_interrupt)
+
+def test_worker_pool():
+    """Test per-service concurrency limits and refusal of excess work"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False, max_workers=4)
+    svc = _BlockingService(_test_capability("10.0.27.1", mplane.model.VERB_QUERY),
+                           max_concurrency=2, max_queued=3)
+    scheduler.add_service(svc)
+
+    replies = []
+    for i in range(6):
+        spec = _test_specification(svc.capability())
+        spec.set_parameter_value("destination.ip4", "10.0.37."+str(i))
+        replies.append(scheduler.submit_job(None, spec))
+    assert all(isinstance(r, mplane.model.Receipt) for r in replies[:5])
+    assert isinstance(replies[5], mplane.model.Exception)
+    assert replies[5]._errmsg.startswith("busy, retry after")
+    assert scheduler._pool.queued(svc) == 3
+
+    # resending a specification returns its receipt, even when busy
+    spec = _test_specification(svc.capability())
+    spec.set_parameter_value("destination.ip4", "10.0.37.4")
+    reply = scheduler.submit_job(None, spec)
+    assert isinstance(reply, mplane.model.Receipt)
+    assert reply.get_token() == replies[4].get_token()
+
+    svc.release.set()
+    jobs = [scheduler.job_for_message(r) for r in replies[:5]]
+    deadline = time.monotonic() + 5
+    while not all(job.finished() for job in jobs) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert all(job.finished() for job in jobs)
+    assert svc.max_running == 2
+    assert scheduler._pool.busy(svc) is None
+    scheduler.close()
+
+class _InterruptibleService(Service):
+    def run(self, specification, check_interrupt):
+        while not check_interrupt():
+            time.sleep(0.01)
+        res = _TestService.run(self, specification, check_interrupt)
+        res.add_metadata("source.device", str(os.getpid()))
+        return res
+
+def test_process_pool():
+    """Test running services in worker processes"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False, max_workers=4)
+    svc = _InterruptibleService(_test_capability("10.0.27.1"), process=True)
+    scheduler.add_service(svc)
+
+    spec = _test_specification(svc.capability(), when="now + 1s / 1s")
+    job = scheduler.job_for_message(scheduler.submit_job(None, spec))
+    deadline = time.monotonic() + 10
+    while not job.finished() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert job.finished() and not job.failed()
+    reply = job.get_reply()
+    assert isinstance(reply, mplane.model.Result)
+    assert reply.count_result_rows() == 3
+    assert reply._metadata["source.device"].get_value() != str(os.getpid())
+    assert reply.get_token() == spec.get_token()
+    scheduler.close()
+
+class _AsyncTestService(AsyncService):
+    async def run(self, specification, check_interrupt):
+        res = mplane.model.Result(specification=specification)
+        res.set_when(mplane.model.When(a=datetime(2014, 12, 24, 22, 18, 42)), force=True)
+        try:
+            for i in range(3):
+                await asyncio.sleep(0.05 if specification.is_query() else 60)
+                res.set_result_value("delay.twoway.icmp.us", i * 100, i)
+        except asyncio.CancelledError:
+            pass
+        return res
+
+def test_async_service():
+    """Test running coroutine services and interrupting them"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False, max_workers=1)
+    qsvc = _AsyncTestService(_test_capability("10.0.27.1", mplane.model.VERB_QUERY),
+                             max_concurrency=50)
+    msvc = _AsyncTestService(_test_capability("10.0.27.1"))
+    scheduler.add_service(qsvc)
+    scheduler.add_service(msvc)
+
+    # many concurrent runs, with a single worker thread
+    jobs = []
+    for i in range(100):
+        spec = _test_specification(qsvc.capability())
+        spec.set_parameter_value("destination.ip4", "10.0.%u.%u" % (i // 100, i % 100))
+        jobs.append(scheduler.job_for_message(scheduler.submit_job(None, spec)))
+
+    # interrupting a run cancels its task
+    spec = _test_specification(msvc.capability(), when="now + 1m / 1s")
+    mjob = scheduler.job_for_message(scheduler.submit_job(None, spec))
+    time.sleep(0.1)
+    mjob.interrupt()
+
+    deadline = time.monotonic() + 5
+    while not all(job.finished() for job in jobs + [mjob]) and \
+          time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert all(job.get_reply().count_result_rows() == 3 for job in jobs)
+    assert mjob.finished() and mjob.get_reply().count_result_rows() == 0
+
+    # cancelling a run before it starts still completes it
+    blocked = threading.Event()
+    scheduler._pool._event_loop().call_soon_threadsafe(blocked.wait, 5)
+    calls = []
+    task = scheduler._pool.start(msvc, spec, InterruptCheck(), 
+                                 lambda result, exception: calls.append(exception))
+    task.cancel()
+    blocked.set()
+    time.sleep(0.1)
+    assert len(calls) == 1 and str(calls[0]) == "Interrupted"
+    scheduler.close()
+
+def test_prune_jobs():
+    """Test removal of redeemed, unredeemed, and least recently used jobs"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False, redeemed_ttl=10, unredeemed_ttl=100)
+    svc = _TestService(_test_capability("10.0.27.1", mplane.model.VERB_QUERY))
+    scheduler.add_service(svc)
+
+    jobs = []
+    for i in range(4):
+        spec = _test_specification(svc.capability())
+        spec.set_parameter_value("destination.ip4", "10.0.37."+str(i))
+        jobs.append(scheduler.job_for_message(scheduler.submit_job(None, spec)))
+    deadline = time.monotonic() + 5
+    while not all(job.completed() for job in jobs) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert all(job.nbytes() > 0 for job in jobs)
+
+    now = datetime.utcnow()
+    jobs[0].get_reply()
+    jobs[1].get_reply()
+    assert scheduler.prune_jobs(now) == 0
+    assert scheduler.prune_jobs(now + timedelta(seconds=11)) == 2
+    assert scheduler.retention_stats()["pruned_redeemed"] == 2
+    assert scheduler.retention_stats()["result_bytes"] == \
+           jobs[2].nbytes() + jobs[3].nbytes()
+
+    jobs[2].get_reply()
+    scheduler.max_result_bytes = jobs[2].nbytes()
+    assert scheduler.prune_jobs(now) == 1
+    assert jobs[2].receipt.get_token() in scheduler.jobs
+    assert scheduler.retention_stats()["pruned_lru"] == 1
+
+    scheduler.max_result_bytes = DEFAULT_MAX_RESULT_BYTES
+    jobs[4:] = [scheduler.job_for_message(scheduler.submit_job(None, spec))]
+    deadline = time.monotonic() + 5
+    while not jobs[4].completed() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    now = datetime.utcnow()
+    assert scheduler.prune_jobs(now + timedelta(seconds=11)) == 1
+    assert scheduler.prune_jobs(now + timedelta(seconds=101)) == 1
+    assert scheduler.retention_stats() == { "jobs": 0, "result_bytes": 0,
+            "pruned_redeemed": 3, "pruned_unredeemed": 1, "pruned_lru": 1 }
+    scheduler.close()
+
+def test_redemption_wait():
+    """Test holding redemptions until results are available"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _BlockingService(_test_capability("10.0.27.1", mplane.model.VERB_QUERY))
+    scheduler.add_service(svc)
+    receipt = scheduler.submit_job(None, _test_specification(svc.capability()))
+    redemption = mplane.model.Redemption(receipt=receipt)
+
+    start = time.monotonic()
+    reply = scheduler.receive_message(None, redemption, wait=0.2)
+    assert isinstance(reply, mplane.model.Receipt)
+    assert time.monotonic() - start >= 0.2
+
+    threading.Timer(0.1, svc.release.set).start()
+    reply = scheduler.receive_message(None, redemption, wait=5)
+    assert isinstance(reply, mplane.model.Result)
+    assert time.monotonic() - start < 5
+    scheduler.close()
+
+def test_coalescing():
+    """Test coalescing equivalent specifications onto one job"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _BlockingService(_test_capability("10.0.27.1"))
+    scheduler.add_service(svc)
+
+    spec = _test_specification(svc.capability(), when="now + 1s / 1s")
+    later = _test_specification(svc.capability())
+    later.set_when(mplane.model.When(a=datetime.utcnow() + timedelta(seconds=0.5),
+                                     d=timedelta(seconds=1), p=timedelta(seconds=1)))
+    other = _test_specification(svc.capability())
+    other.set_parameter_value("destination.ip4", "10.0.37.3")
+    assert spec.get_token() != later.get_token()
+
+    receipts = [scheduler.submit_job(None, s) for s in (spec, later, other)]
+    jobs = [scheduler.job_for_message(r) for r in receipts]
+    assert jobs[1]._leader is jobs[0]
+    assert jobs[2]._leader is None
+    assert scheduler.coalesce_stats() == { "coalescing": 2, "coalesced": 1 }
+
+    svc.release.set()
+    deadline = time.monotonic() + 5
+    while not all(job.completed() for job in jobs) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    results = [job.get_reply() for job in jobs]
+    assert all(isinstance(r, mplane.model.Result) for r in results)
+    assert [r.get_token() for r in results] == [r.get_token() for r in receipts]
+    assert results[1].count_result_rows() == 3
+    assert svc.runs == 2
+    assert scheduler.coalesce_stats()["coalescing"] == 0
+    scheduler.close()
+
+def test_query_cache():
+    """Test answering repeated queries from the result cache"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False, coalesce_tolerance=None)
+    svc = _BlockingService(_test_capability("10.0.27.1", mplane.model.VERB_QUERY),
+                           cache_ttl=60)
+    svc.release.set()
+    scheduler.add_service(svc)
+
+    spec = _test_specification(svc.capability())
+    first = scheduler.job_for_message(scheduler.submit_job(None, spec))
+    first.completion().result(timeout=5)
+    assert scheduler.query_cache_stats()["entries"] == 1
+
+    first.get_reply()
+    assert scheduler.prune_jobs(datetime.utcnow() + timedelta(seconds=3600)) == 1
+    receipt = scheduler.submit_job(None, _test_specification(svc.capability()))
+    job = scheduler.job_for_message(receipt)
+    assert job.completed()
+    reply = job.get_reply()
+    assert isinstance(reply, mplane.model.Result)
+    assert reply.get_token() == receipt.get_token()
+    assert reply.count_result_rows() == 3
+    assert svc.runs == 1
+    assert scheduler.query_cache_stats()["hits"] == 1
+
+    cache = QueryCache(max_bytes=first.nbytes())
+    other = _test_specification(svc.capability())
+    other.set_parameter_value("destination.ip4", "10.0.37.3")
+    cache.put(svc, spec, first.result, 60)
+    cache.put(svc, other, first.result, 60)
+    assert cache.get(svc, spec) is None
+    assert cache.get(svc, other) is not None
+    cache.put(svc, other, first.result, -1)
+    assert cache.get(svc, other) is None
+    assert cache.stats()["evicted"] == 1
+    scheduler.close()
+
+class _CancellableService(Service):
+    def run(self, specification, check_interrupt):
+        # stands in for a subprocess killed on interrupt
+        released = threading.Event()
+        check_interrupt.on_interrupt(released.set)
+        released.wait(5)
+        return _TestService.run(self, specification, check_interrupt)
+
+def test_interrupt_message():
+    """Test interrupting jobs with Interrupt messages"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _CancellableService(_test_capability("10.0.27.1"))
+    scheduler.add_service(svc)
+
+    spec = _test_specification(svc.capability(), when="now + 1m / 1s")
+    receipt = scheduler.submit_job(None, spec)
+    later = _test_specification(svc.capability())
+    later.set_when(mplane.model.When(a=datetime.utcnow() + timedelta(seconds=0.5),
+                                     d=timedelta(minutes=1), p=timedelta(seconds=1)))
+    follower = scheduler.job_for_message(scheduler.submit_job(None, later))
+    job = scheduler.job_for_message(receipt)
+    assert follower._leader is job
+    time.sleep(0.1)
+
+    # interrupting a subscriber leaves the job running
+    reply = scheduler.receive_message(None, mplane.model.Interrupt(specification=later))
+    assert isinstance(reply, mplane.model.Exception)
+    assert not job.completed()
+
+    start = time.monotonic()
+    scheduler.receive_message(None, mplane.model.Interrupt(specification=receipt))
+    job.completion().result(timeout=5)
+    assert time.monotonic() - start < 1
+    assert isinstance(job.get_reply(), mplane.model.Result)
+
+    # interrupting a job with subscribers hands its run on
+    specs = []
+    for delay in (0.05, 0.25, 0.5):
+        specs.append(_test_specification(svc.capability(), when=mplane.model.When(
+                        a=datetime.utcnow() + timedelta(seconds=delay),
+                        d=timedelta(minutes=1), p=timedelta(seconds=1))))
+    jobs = [scheduler.job_for_message(scheduler.submit_job(None, s)) for s in specs]
+    assert jobs[1]._leader is jobs[0] and jobs[2]._leader is jobs[0]
+    time.sleep(0.2)
+    scheduler.receive_message(None, mplane.model.Interrupt(specification=specs[0]))
+    assert isinstance(jobs[0].get_reply(), mplane.model.Exception)
+    assert jobs[1]._leader is None and jobs[2]._leader is jobs[1]
+    assert not jobs[1].completed()
+    assert scheduler._coalescing_job(svc, specs[2]) is jobs[1]
+
+    start = time.monotonic()
+    scheduler.receive_message(None, mplane.model.Interrupt(specification=specs[2]))
+    assert isinstance(jobs[2].get_reply(), mplane.model.Exception)
+    scheduler.receive_message(None, mplane.model.Interrupt(specification=specs[1]))
+    jobs[1].completion().result(timeout=5)
+    assert time.monotonic() - start < 1
+    reply = jobs[1].get_reply()
+    assert isinstance(reply, mplane.model.Result)
+    assert reply.get_token() == specs[1].get_token()
+
+    reply = scheduler.receive_message(None, mplane.model.Interrupt(token="nonexistent"))
+    assert isinstance(reply, mplane.model.Exception)
+
+    check = InterruptCheck()
+    calls = []
+    check.on_interrupt(lambda: calls.append(1))
+    check.set()
+    check.set()
+    check.on_interrupt(lambda: calls.append(2))
+    assert check() and calls == [1, 2]
+    scheduler.close()
+
+class _StreamingTestService(StreamingService):
+    def __init__(self, capability):
+        super(_StreamingTestService, self).__init__(capability)
+        self.emitted = threading.Event()
+        self.release = threading.Event()
+
+    def run(self, specification, check_interrupt, stream):
+        stream.extend([[100], [200]])
+        self.emitted.set()
+        self.release.wait(5)
+        stream.append([300])
+        stream.finish(mplane.model.When(a=datetime(2014, 12, 24, 22, 18, 42)))
+
+def test_streaming_service():
+    """Test redeeming partial results from a streaming service"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _StreamingTestService(_test_capability("10.0.27.1"))
+    scheduler.add_service(svc)
+    receipt = scheduler.submit_job(None, _test_specification(svc.capability()))
+    redemption = mplane.model.Redemption(receipt=receipt)
+    job = scheduler.job_for_message(receipt)
+    assert svc.emitted.wait(5)
+
+    partial = scheduler.receive_message(None, redemption)
+    assert isinstance(partial, mplane.model.Result) and partial.is_partial()
+    assert partial.get_cursor() == 2
+    assert list(partial._resultcolumns["delay.twoway.icmp.us"]) == [100, 200]
+    assert partial.when().is_definite()
+    partial = mplane.model.parse_json(mplane.model.unparse_json(partial))
+    assert partial.is_partial() and partial.get_cursor() == 2
+
+    svc.release.set()
+    result = scheduler.receive_message(None, redemption, wait=5)
+    assert not result.is_partial()
+    assert result is job._stream.result()
+    assert result.get_cursor() == 3
+    assert list(result._resultcolumns["delay.twoway.icmp.us"]) == [100, 200, 300]
+    scheduler.close()
+
+def test_redemption_cursor():
+    """Test incremental redemption of results with a cursor"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _StreamingTestService(_test_capability("10.0.27.1"))
+    scheduler.add_service(svc)
+    receipt = scheduler.submit_job(None, _test_specification(svc.capability()))
+    assert svc.emitted.wait(5)
+
+    held = scheduler.receive_message(None, mplane.model.Redemption(receipt=receipt, cursor=0))
+    assert held.count_result_rows() == 2 and held.get_cursor() == 2
+    reply = scheduler.receive_message(None, mplane.model.Redemption(receipt=receipt, cursor=2))
+    assert reply.is_partial() and reply.count_result_rows() == 0
+    assert reply.get_cursor() == 2
+
+    svc.release.set()
+    redemption = mplane.model.Redemption(receipt=receipt, cursor=held.get_cursor())
+    redemption = mplane.model.parse_json(mplane.model.unparse_json(redemption))
+    reply = scheduler.receive_message(None, redemption, wait=5)
+    assert not reply.is_partial()
+    assert reply.count_result_rows() == 1 and reply.get_cursor() == 3
+    held.append_result(reply)
+    assert list(held._resultcolumns["delay.twoway.icmp.us"]) == [100, 200, 300]
+    scheduler.close()
+
+def test_redemption_select():
+    """Test projection and filtering of results on redemption"""
+    mplane.model.initialize_registry()
+    scheduler = Scheduler(security=False)
+    svc = _TestService(_test_capability("10.0.27.1", mplane.model.VERB_QUERY))
+    scheduler.add_service(svc)
+    receipt = scheduler.submit_job(None, _test_specification(svc.capability()))
+    scheduler.job_for_message(receipt).completion().result(timeout=5)
+
+    redemption = mplane.model.Redemption(receipt=receipt, 
+                    projection=["delay.twoway.icmp.us"], 
+                    filters=[("delay.twoway.icmp.us", ">", 0)])
+    redemption = mplane.model.parse_json(mplane.model.unparse_json(redemption))
+    reply = scheduler.receive_message(None, redemption)
+    assert isinstance(reply, mplane.model.Result)
+    assert list(reply._resultcolumns["delay.twoway.icmp.us"]) == [100, 200]
+
+    redemption = mplane.model.Redemption(receipt=receipt, cursor=2, 
+                    filters=[("delay.twoway.icmp.us", ">", 0)])
+    reply = scheduler.receive_message(None, redemption)
+    assert reply.count_result_rows() == 1 and reply.get_cursor() == 3
+
+    redemption = mplane.model.Redemption(receipt=receipt, projection=["nonexistent"])
+    reply = scheduler.receive_message(None, redemption)
+    assert isinstance(reply, mplane.model.Exception)
+
+    # malformed filters are refused, not raised
+    for bad in (["delay.twoway.icmp.us", ">", [1]], [5, ">", "1"], 
+                ["delay.twoway.icmp.us", ">", None], ["delay.twoway.icmp.us", ">"],
+                ["delay.twoway.icmp.us", [">"], "1"], ["delay.twoway.icmp.us", ">", "x"]):
+        redemption = mplane.model.Redemption(receipt=receipt)
+        redemption._filters = [bad]
+        reply = scheduler.receive_message(None, redemption)
+        assert isinstance(reply, mplane.model.Exception)
+        d = mplane.model.Redemption(receipt=receipt).to_dict()
+        d[mplane.model.KEY_FILTER] = [bad]
+        try:
+            mplane.model.message_from_dict(d)
+            assert bad[2] == "x"
+        except ValueError:
+            pass
+    scheduler.close()